@@ -0,0 +1,121 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+RESULTS_DIR = "sim_results_2herb"
+OUTPUT_FILE = "gene_stats_2herb.csv"
+# Rows read at a time from a CSV file
+CHUNK_ROWS = 1000
+
+def read_chunks(filename):
+    """Yields the rows of a sim_{id} file of the collector, CSV or .npz, as DataFrames of a chunk each."""
+    if filename.endswith('.npz'):
+        with np.load(filename) as archive:
+            metadata = json.loads(archive['metadata'].item())
+            for k in range(metadata['chunks']):
+                yield pd.DataFrame({name: archive[f"{name}/{k}"] for name in metadata['columns']})
+    else:
+        yield from pd.read_csv(filename, chunksize=CHUNK_ROWS)
+
+class StepStats():
+    """
+    Welford accumulators of every column, per step: the number of runs that
+    reached the step and the running mean and sum of squared deviations (M2)
+    of the column over those runs. Memory depends on the number of steps and
+    columns only, not on the number of runs.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros((0, len(columns)))
+        self.m2 = np.zeros((0, len(columns)))
+
+    def reserve(self, steps):
+        """Makes room for steps 0 to steps - 1."""
+        extra = steps - len(self.count)
+        if extra > 0:
+            self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+            self.mean = np.concatenate([self.mean, np.zeros((extra, len(self.columns)))])
+            self.m2 = np.concatenate([self.m2, np.zeros((extra, len(self.columns)))])
+
+    def add(self, steps, values):
+        """Adds the rows of one run, `values` holding the columns at the given (distinct) steps."""
+        self.reserve(steps.max() + 1)
+        count = self.count[steps] + 1
+        delta = values - self.mean[steps]
+        mean = self.mean[steps] + delta / count[:, None]
+        self.m2[steps] += delta * (values - mean)
+        self.mean[steps] = mean
+        self.count[steps] = count
+
+    def merge(self, other):
+        """Adds the runs of another StepStats, combining the accumulators step by step (Chan et al.)."""
+        steps = len(other.count)
+        self.reserve(steps)
+        count_a, count_b = self.count[:steps], other.count
+        count = count_a + count_b
+        # Steps no run of either side reached stay empty
+        share = np.divide(count_b, count, out=np.zeros(steps), where=count > 0)[:, None]
+        delta = other.mean - self.mean[:steps]
+        self.m2[:steps] += other.m2 + delta**2 * (count_a[:, None] * share)
+        self.mean[:steps] += delta * share
+        self.count[:steps] = count
+
+    def to_frame(self):
+        """
+        Returns the mean and sample standard deviation of every column per
+        step, like groupby('step').mean() and .std(): the std is NaN at steps
+        reached by a single run.
+        """
+        steps = np.flatnonzero(self.count)
+        count = self.count[steps][:, None]
+        std = np.sqrt(np.divide(self.m2[steps], count - 1, out=np.full((len(steps), len(self.columns)), np.nan),
+                                where=count > 1))
+        mean_df = pd.DataFrame(self.mean[steps], columns=self.columns).add_suffix('_mean')
+        std_df = pd.DataFrame(std, columns=self.columns).add_suffix('_std')
+        return pd.concat([pd.DataFrame({'step': steps}), mean_df, std_df], axis=1)
+
+def aggregate_files(filenames):
+    """Returns the StepStats of the given sim_{id} files, read a chunk at a time."""
+    stats = None
+    for filename in filenames:
+        for chunk in read_chunks(filename):
+            if stats is None:
+                stats = StepStats([name for name in chunk.columns if name != 'step'])
+            stats.add(chunk['step'].to_numpy(), chunk[stats.columns].to_numpy(dtype=float))
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="number of processes reading the files (default: one per CPU)")
+    args = parser.parse_args()
+
+    all_files = sorted(glob.glob(os.path.join(RESULTS_DIR, "sim_*.csv")) + glob.glob(os.path.join(RESULTS_DIR, "sim_*.npz")))
+
+    if not all_files:
+        print("No data found!")
+        return
+
+    # Every worker streams its share of the files into its own accumulators, merged at the end
+    workers = max(1, min(args.workers, len(all_files)))
+    if workers == 1:
+        stats = aggregate_files(all_files)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(aggregate_files, [all_files[k::workers] for k in range(workers)]))
+        stats = parts[0]
+        for part in parts[1:]:
+            stats.merge(part)
+
+    final_df = stats.to_frame()
+
+    final_df.to_csv(OUTPUT_FILE, index=False)
+    print(f"Created {OUTPUT_FILE}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
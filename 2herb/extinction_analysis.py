@@ -1,51 +1,80 @@
-import pandas as pd
-import glob
+import argparse
 import os
+import re
+import warnings
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
 RESULTS_DIR = "sim_results_2herb"
-TARGET_COLUMN = "herb_no_armor_count"
+CATALOG_FILE = os.path.join(RESULTS_DIR, "summary.csv")
+# Species analyzed, by its column prefix in the catalog
+TARGET_PREFIX = "herb_no_armor"
+# Resamples of the bootstrap confidence intervals
+BOOTSTRAP_SAMPLES = 2000
+
+def load_catalog(config_hash=None):
+    """
+    Reads the catalog of the collector, one row per run, keeping the runs 
+    made with one set of settings: `config_hash`, or the one of the latest run.
+    Warns about sim_{id} files without a catalog row, runs of a killed 
+    campaign that the analysis leaves out until the collector runs them again.
+    """
+    catalog = pd.read_csv(CATALOG_FILE, dtype={'config_hash': str})
+    sim_ids = {int(match.group(1)) for match in map(re.compile(r'sim_(\d+)\.(csv|npz)$').match, os.listdir(RESULTS_DIR))
+               if match}
+    uncatalogued = sorted(sim_ids - set(catalog['sim_id']))
+    if uncatalogued:
+        warnings.warn(f"{len(uncatalogued)} simulations in {RESULTS_DIR} have no catalog row and are left out: "
+                      f"{uncatalogued}; run the collector again to complete them")
+    if config_hash is None:
+        config_hash = catalog['config_hash'].iloc[-1]
+    runs = catalog[catalog['config_hash'] == config_hash]
+    if len(runs) < len(catalog):
+        print(f"Using the {len(runs)} runs with config {config_hash}, {len(catalog) - len(runs)} others left out")
+    return runs
+
+def bootstrap_ci(values, level=0.95, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """Returns the percentile bootstrap confidence interval of the mean of `values`, all resamples at once."""
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(samples, len(values)))].mean(axis=1)
+    return tuple(np.quantile(means, [(1 - level) / 2, (1 + level) / 2]))
+
+def extinction_table(runs, prefix):
+    """
+    Returns, per run, the step the species first hit 0 (the run's duration 
+    if it never did), whether it survived and the share of the run it lived.
+    """
+    zero_step = runs[f'{prefix}_zero_step']
+    total_duration = runs['duration_steps']
+    extinction_step = zero_step.fillna(total_duration)
+    return pd.DataFrame({
+        'sim_id': runs['sim_id'],
+        'extinction_step': extinction_step,
+        'total_duration': total_duration,
+        'survived': zero_step.isna(),
+        'lifespan_ratio': (extinction_step / total_duration.where(total_duration > 0)).fillna(0)
+    })
 
 def analyze_extinction():
-    file_pattern = os.path.join(RESULTS_DIR, "sim_*.csv")
-    files = glob.glob(file_pattern)
-    
-    if not files:
-        print(f"No files found in {RESULTS_DIR}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config-hash', default=None,
+                        help="settings of the runs to analyze (default: the ones of the latest run)")
+    args = parser.parse_args()
+
+    if not os.path.exists(CATALOG_FILE):
+        print(f"No catalog found in {RESULTS_DIR}")
         return
 
-    data_points = []
-    
-    print(f"Analyzing {len(files)} simulation files...")
-
-    for filepath in files:
-        try:
-            df = pd.read_csv(filepath)
-            sim_id = os.path.basename(filepath).replace("sim_", "").replace(".csv", "")
-
-            total_duration = df['step'].max()
-
-            zero_count_rows = df[df[TARGET_COLUMN] == 0]
-            
-            if not zero_count_rows.empty:
-                extinction_step = zero_count_rows.iloc[0]['step']
-                survived = False
-            else:
-                extinction_step = total_duration
-                survived = True
-            
-            data_points.append({
-                'sim_id': sim_id,
-                'extinction_step': extinction_step,
-                'total_duration': total_duration,
-                'survived': survived,
-                'lifespan_ratio': extinction_step / total_duration if total_duration > 0 else 0
-            })
-                
-        except Exception as e:
-            print(f"Error reading {filepath}: {e}")
-
-    results_df = pd.DataFrame(data_points)
+    runs = load_catalog(args.config_hash)
+    if runs.empty:
+        print(f"No runs with config {args.config_hash}")
+        return
+
+    results_df = extinction_table(runs, TARGET_PREFIX)
+
+    print(f"Analyzing {len(results_df)} simulations...")
 
     extinct_df = results_df[results_df['survived'] == False]
     survived_df = results_df[results_df['survived'] == True]
@@ -55,6 +84,8 @@ def analyze_extinction():
     print("="*50)
     print(f"Total Simulations:          {len(results_df)}")
     print(f"Extinction Events:          {len(extinct_df)} ({len(extinct_df)/len(results_df)*100:.1f}%)")
+    low, high = bootstrap_ci(~results_df['survived'])
+    print(f"  95% CI:                   {low*100:.1f}% - {high*100:.1f}%")
     print(f"Survival Events:            {len(survived_df)}")
     print("-" * 50)
     
@@ -65,8 +96,10 @@ def analyze_extinction():
 
         print(f"Avg Duration of Sim:        {avg_duration:.0f} steps")
         print(f"Avg Time to Extinction:     {avg_step:.0f} steps")
+        low, high = bootstrap_ci(extinct_df['extinction_step'])
+        print(f"  95% CI:                   {low:.0f} - {high:.0f} steps")
         print(f"Avg % of Sim Survived:      {avg_ratio*100:.1f}% (for extinct cases)")
-        print(f"Fastest Extinction:         Step {extinct_df['extinction_step'].min()}")
+        print(f"Fastest Extinction:         Step {extinct_df['extinction_step'].min():.0f}")
         print("-" * 50)
 
         plt.figure(figsize=(10, 6))
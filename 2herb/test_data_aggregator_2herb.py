@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+import data_aggregator_2herb as aggregator
+import data_collector_2herb as collector
+
+def write_runs(directory, lengths, seed=0):
+    """Made-up sim_{id} files of the given numbers of steps, every other one as .npz."""
+    rng = np.random.default_rng(seed)
+    filenames = []
+    for sim_id, length in enumerate(lengths):
+        file_format = collector.OUTPUT_FORMATS[sim_id % 2]
+        filename = str(directory / f"sim_{sim_id}.{file_format}")
+        output = collector.RunWriter(filename, collector.COLUMNS, file_format, {'sim_id': sim_id}, chunk_size=7)
+        for step in range(length):
+            row = {name: rng.normal(5, 2) for name in collector.COLUMNS}
+            row.update({name: rng.integers(0, 500) for name in collector.COLUMNS if name.endswith('_count')})
+            row['step'] = step
+            output.append(row)
+        output.close()
+        filenames.append(filename)
+    return filenames
+
+def grouped_stats(filenames):
+    """The per-step mean and std of all the files at once, with pd.concat and groupby."""
+    data = pd.concat([chunk for filename in filenames for chunk in aggregator.read_chunks(filename)])
+    grouped = data.astype(float).groupby('step')
+    columns = [name for name in data.columns if name != 'step']
+    mean_df = grouped[columns].mean().add_suffix('_mean')
+    std_df = grouped[columns].std().add_suffix('_std')
+    steps = pd.DataFrame({'step': mean_df.index.to_numpy(dtype=np.int64)})
+    return pd.concat([steps, mean_df.reset_index(drop=True), std_df.reset_index(drop=True)], axis=1)
+
+# Runs of different lengths, so that the last steps are reached by fewer runs, the very last by one
+LENGTHS = [30, 12, 25, 30, 1, 31, 18]
+
+def test_step_stats_match_groupby(tmp_path):
+    filenames = write_runs(tmp_path, LENGTHS)
+    pd.testing.assert_frame_equal(aggregator.aggregate_files(filenames).to_frame(), grouped_stats(filenames))
+
+@pytest.mark.parametrize('parts', [2, 3, len(LENGTHS)])
+def test_merged_step_stats_match_groupby(tmp_path, parts):
+    filenames = write_runs(tmp_path, LENGTHS)
+    stats = [aggregator.aggregate_files(filenames[k::parts]) for k in range(parts)]
+    merged = stats[0]
+    for part in stats[1:]:
+        merged.merge(part)
+    pd.testing.assert_frame_equal(merged.to_frame(), grouped_stats(filenames))
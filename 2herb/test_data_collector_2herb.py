@@ -0,0 +1,157 @@
+import csv
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+import data_collector_2herb as collector
+
+@pytest.fixture
+def campaign(tmp_path, monkeypatch):
+    """A short campaign in a temporary OUTPUT_DIR; calling it runs main() with the given arguments."""
+    monkeypatch.setattr(collector, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(collector, 'NUM_SIMULATIONS', 3)
+    monkeypatch.setattr(collector, 'MAX_STEPS', 15)
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['data_collector_2herb.py', '--seed', '11', *args])
+        collector.main()
+    return run
+
+ROWS = 23
+
+def make_rows(count=ROWS, seed=0):
+    """Rows of a made-up run, with every column of the collector."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for step in range(count):
+        row = {name: float(rng.normal(5, 2)) for name in collector.COLUMNS}
+        row.update({name: int(rng.integers(0, 500)) for name in collector.COLUMNS if name.endswith('_count')})
+        row['step'] = step
+        rows.append(row)
+    return rows
+
+def write_run(filename, file_format, rows, **options):
+    output = collector.RunWriter(str(filename), collector.COLUMNS, file_format, {'sim_id': 0, 'seed': 1}, **options)
+    for row in rows:
+        output.append(row)
+    output.close()
+
+def read_npz(filename):
+    """The metadata and the arrays of every entry of a RunWriter .npz archive."""
+    with np.load(filename) as archive:
+        return json.loads(archive['metadata'].item()), {name: archive[name] for name in archive.files if name != 'metadata'}
+
+def test_npz_output_holds_the_rows_of_the_csv_one(tmp_path):
+    rows = make_rows()
+    write_run(tmp_path / "sim_0.csv", 'csv', rows, chunk_size=10)
+    write_run(tmp_path / "sim_0.npz", 'npz', rows, chunk_size=10)
+    metadata, arrays = read_npz(tmp_path / "sim_0.npz")
+    assert metadata == {'sim_id': 0, 'seed': 1, 'columns': collector.COLUMNS, 'chunks': 3}
+    expected = pd.read_csv(tmp_path / "sim_0.csv")
+    assert list(expected.columns) == collector.COLUMNS
+    for name in collector.COLUMNS:
+        column = np.concatenate([arrays[f"{name}/{k}"] for k in range(3)])
+        integer = name == 'step' or name.endswith('_count')
+        assert column.dtype == (np.int32 if integer else np.float32), name
+        np.testing.assert_allclose(column, expected[name], rtol=1e-6, err_msg=name)
+
+def npz_columns(filename):
+    """The columns of a RunWriter .npz archive, its chunks joined."""
+    metadata, arrays = read_npz(filename)
+    return {name: np.concatenate([arrays[f"{name}/{k}"] for k in range(metadata['chunks'])])
+            for name in metadata['columns']}
+
+@pytest.mark.parametrize('chunk_size', [1, 7, ROWS, 1000])
+@pytest.mark.parametrize('background', [False, True])
+def test_output_does_not_depend_on_chunking(tmp_path, chunk_size, background):
+    rows = make_rows()
+    write_run(tmp_path / "expected.csv", 'csv', rows)
+    write_run(tmp_path / "expected.npz", 'npz', rows)
+    write_run(tmp_path / "sim_0.csv", 'csv', rows, chunk_size=chunk_size, background=background)
+    write_run(tmp_path / "sim_0.npz", 'npz', rows, chunk_size=chunk_size, background=background)
+    assert (tmp_path / "sim_0.csv").read_bytes() == (tmp_path / "expected.csv").read_bytes()
+    columns, expected = npz_columns(tmp_path / "sim_0.npz"), npz_columns(tmp_path / "expected.npz")
+    for name in collector.COLUMNS:
+        np.testing.assert_array_equal(columns[name], expected[name], err_msg=name)
+    assert sorted(os.listdir(tmp_path)) == ["expected.csv", "expected.npz", "sim_0.csv", "sim_0.npz"]
+
+@pytest.mark.parametrize('file_format', collector.OUTPUT_FORMATS)
+@pytest.mark.parametrize('background', [False, True])
+def test_resumed_output_matches_an_uninterrupted_one(tmp_path, file_format, background):
+    rows = make_rows()
+    expected = tmp_path / f"expected.{file_format}"
+    write_run(expected, file_format, rows, chunk_size=5)
+    filename = str(tmp_path / f"sim_0.{file_format}")
+    killed = collector.RunWriter(filename, collector.COLUMNS, file_format, {'sim_id': 0, 'seed': 1}, 5, background)
+    for row in rows[:12]:
+        killed.append(row)
+    position = killed.checkpoint()
+    # Rows after the checkpoint, most of them written out, are lost with the process; other and more 
+    # rows than the resumed writer writes, so that only dropping them gives back the expected file
+    for row in make_rows(ROWS + 10, seed=1)[12:]:
+        killed.append(row)
+    killed._wait()
+    if killed.file is not None:
+        killed.file.close()
+    write_run(filename, file_format, rows[12:], chunk_size=5, background=background, resume=position)
+    if file_format == 'csv':
+        assert (tmp_path / "sim_0.csv").read_bytes() == expected.read_bytes()
+    else:
+        columns, expected_columns = npz_columns(filename), npz_columns(expected)
+        for name in collector.COLUMNS:
+            np.testing.assert_array_equal(columns[name], expected_columns[name], err_msg=name)
+
+class Killed(Exception):
+    pass
+
+@pytest.mark.parametrize('file_format', collector.OUTPUT_FORMATS)
+def test_simulation_resumed_from_a_checkpoint_matches_an_uninterrupted_one(campaign, monkeypatch, file_format):
+    def output():
+        """The checksums and the time series written for simulation 0."""
+        with open(collector.checksums_path(0)) as f:
+            checksums = f.read()
+        if file_format == 'csv':
+            with open(collector.sim_path(0, 'csv'), 'rb') as f:
+                return checksums, f.read()
+        metadata, arrays = read_npz(collector.sim_path(0, 'npz'))
+        return checksums, metadata, {name: array.tolist() for name, array in arrays.items()}
+
+    options = {'file_format': file_format, 'chunk_size': 4, 'checkpoint_every': 5}
+    expected_result = collector.run_single_simulation(0, 42, **options)
+    expected = output()
+
+    save_checkpoint = collector.save_checkpoint
+    def save_checkpoint_then_die(sim_id, step, *args):
+        save_checkpoint(sim_id, step, *args)
+        if step == 9:
+            raise Killed()
+    monkeypatch.setattr(collector, 'save_checkpoint', save_checkpoint_then_die)
+    with pytest.raises(Killed):
+        collector.run_single_simulation(0, 42, **options)
+    monkeypatch.setattr(collector, 'save_checkpoint', save_checkpoint)
+    assert collector.load_checkpoint(0)['step'] == 9
+    assert collector.run_single_simulation(0, 42, **options) == expected_result
+    assert output() == expected
+    assert collector.load_checkpoint(0) is None
+
+def read_summary():
+    with open(os.path.join(collector.OUTPUT_DIR, "summary.csv"), newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_run_without_summary_row_runs_again(campaign):
+    campaign()
+    rows = read_summary()
+    # A campaign killed after a worker wrote sim_1 but before the parent wrote its row
+    with open(os.path.join(collector.OUTPUT_DIR, "summary.csv"), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(row for row in rows if row['sim_id'] != '1')
+    assert collector.finished_simulations(os.path.join(collector.OUTPUT_DIR, "summary.csv")) == {0, 2}
+    campaign()
+    assert sorted(read_summary(), key=lambda row: row['sim_id']) == rows
+
+def test_replay_without_summary_row_is_an_error(campaign, capsys):
+    with pytest.raises(SystemExit):
+        campaign('--replay', '0')
+    assert "has no row" in capsys.readouterr().err
@@ -1,186 +1,459 @@
 import streamlit as st
 from source_2herb_2carn import World, Herbivore_Armored, Herbivore_Fast, Carnivore_Strong, Carnivore_Fast
-import matplotlib.pyplot as plt
+import math
+import queue
+import threading
 import time
+from collections import deque, namedtuple
+from PIL import Image
+import numpy as np
 import config_2herb_2carn as config
 import pandas as pd
 
 st.set_page_config(layout="wide")
 st.title("SPECIES: Niche Partitioning Experiment")
 
-def get_population_stats(entities):
+# Grid colours per species, lighter for the fast variants
+SPECIES_COLORS = {
+    Herbivore_Armored: [0, 0, 1],
+    Herbivore_Fast: [0.3, 0.7, 1],
+    Carnivore_Strong: [1, 0, 0],
+    Carnivore_Fast: [1, 0.6, 0]
+}
+
+# Frames the simulation thread may publish ahead of the display
+FRAME_QUEUE_SIZE = 2
+# Default targets of the frames drawn and the ticks simulated per second
+DISPLAY_FPS = 60
+TICKS_PER_SECOND = config.FPS
+# The frame rate the render budget never goes below to let the simulation keep its pace
+MIN_FPS = 5
+# Share of the time left to drawing frames when running as fast as possible
+FAST_RENDER_SHARE = 0.2
+# Weight of the latest measure in the running averages of the step and render times
+TIMING_SMOOTHING = 0.1
+# The grid is drawn GRID_SCALE pixels per cell, about GRID_IMAGE_SIZE pixels wide
+GRID_IMAGE_SIZE = 800
+GRID_SCALE = max(1, GRID_IMAGE_SIZE // config.DIM)
+# Rendered frames the rates in the sidebar are averaged over
+FPS_WINDOW = 30
+# Latest ticks kept at full resolution in the population history, older ones
+# are downsampled to at most HISTORY_ARCHIVE points
+HISTORY_SIZE = 2000
+HISTORY_ARCHIVE = 2000
+# Downsampling factor of the ticks leaving the full resolution history
+HISTORY_DOWNSAMPLE = 10
+
+# Population chart series and the species they count
+HISTORY_SERIES = {'Herb (Armor)': 'Herbivore_Armored', 'Herb (Fast)': 'Herbivore_Fast',
+                  'Carn (Strong)': 'Carnivore_Strong', 'Carn (Fast)': 'Carnivore_Fast'}
+
+# What the UI shows of one tick, built in the simulation thread and never modified:
+# the grid as grid_indices() and the stats as world.stats(), with the 'max' of world.gene_maxima()
+# added to every species
+Frame = namedtuple('Frame', ['tick', 'grid', 'stats'])
+
+def get_population_stats(species_stats):
     """
-    Calculates average and max stats for a list of animal entities.
-    Returns a formatted Pandas DataFrame.
+    Returns the average, maximum and standard deviation of every gene of a 
+    species, from its entry of Frame.stats, as a formatted Pandas DataFrame.
     """
-    if not entities:
+    if not species_stats['count']:
         return pd.DataFrame()
 
-    genomes = [e.get_genome() for e in entities]
-    df = pd.DataFrame(genomes)
-
-    display_cols = [col for col in df.columns if not col.startswith('w_')]
+    stats_df = pd.DataFrame({'Avg': species_stats['mean'], 'Max': species_stats['max'],
+                             'Std': species_stats['std']})
 
-    stats_df = pd.concat([
-        df[display_cols].mean().rename('Avg'), 
-        df[display_cols].max().rename('Max')
-    ], axis=1)
+    display_rows = [gene for gene in stats_df.index if not gene.startswith('w_')]
     
-    return stats_df.round(2)
-
-if 'world' not in st.session_state:
-    st.session_state.world = World()
-    st.session_state.world.init_population()
-    st.session_state.running = False
-    st.session_state.tick = 0
-    st.session_state.history = []
-
-def run_simulation():
-    st.session_state.running = True
-    while st.session_state.running:
-        st.session_state.world.step()
-        st.session_state.tick += 1
-
-        all_entities = st.session_state.world.all_entities
-        
-        h_armored = [e for e in all_entities if isinstance(e, Herbivore_Armored)]
-        h_fast    = [e for e in all_entities if isinstance(e, Herbivore_Fast)]
-        c_strong  = [e for e in all_entities if isinstance(e, Carnivore_Strong)]
-        c_fast    = [e for e in all_entities if isinstance(e, Carnivore_Fast)]
-
-        st.session_state.history.append({
-            'Tick': st.session_state.tick,
-            'Herb (Armor)': len(h_armored),
-            'Herb (Fast)': len(h_fast),
-            'Carn (Strong)': len(c_strong),
-            'Carn (Fast)': len(c_fast)
-        })
-
-        ax.clear()
-        ax.imshow(st.session_state.world.create_grid_image(), interpolation='nearest')
-        ax.axis('off')
-        grid_placeholder.pyplot(fig)
-
-        if st.session_state.history:
-            history_df = pd.DataFrame(st.session_state.history).set_index('Tick')
-            line_chart_placeholder.line_chart(history_df)
-
-        with stats_placeholder.container():
-            st.subheader("Population Statistics")
-
-            row1_col1, row1_col2 = st.columns(2)
-            with row1_col1:
-                st.markdown("### Standard Herbivores")
-                st.metric("Count", len(h_armored))
-                st.dataframe(get_population_stats(h_armored), width='stretch')
-            
-            with row1_col2:
-                st.markdown("### Light Herbivores")
-                st.metric("Count", len(h_fast))
-                st.dataframe(get_population_stats(h_fast), width='stretch')
-
-            st.divider()
-
-            # Row 2: Carnivores
-            row2_col1, row2_col2 = st.columns(2)
-            with row2_col1:
-                st.markdown("### Standard Carnivores")
-                st.metric("Count", len(c_strong))
-                st.dataframe(get_population_stats(c_strong), width='stretch')
-            
-            with row2_col2:
-                st.markdown("### Light Carnivores")
-                st.metric("Count", len(c_fast))
-                st.dataframe(get_population_stats(c_fast), width='stretch')
-
-        tick_counter_placeholder.write(f"**Tick:** {st.session_state.tick}")
-
-        total_herbivores = len(h_armored) + len(h_fast)
-        total_carnivores = len(c_strong) + len(c_fast)
-        
-        if total_herbivores == 0:
-            st.session_state.running = False
-            st.toast("Simulation Stopped: All herbivores are extinct.")
-        elif total_carnivores == 0:
-            st.session_state.running = False
-            st.toast("Simulation Stopped: All carnivores are extinct.")
-
-        time.sleep(1 / config.FPS)
+    return stats_df.loc[display_rows].round(2)
 
-with st.sidebar:
-    st.header("Controls")
-    if st.button("Start", key="start", width='stretch'):
-        st.session_state.running = True
-    if st.button("Stop", key="stop", width='stretch'):
-        st.session_state.running = False
-    if st.button("Reset World", key="reset", width='stretch'):
-        st.session_state.world = World()
-        st.session_state.world.init_population()
-        st.session_state.running = False
-        st.session_state.tick = 0
-        st.session_state.history = []
-        st.rerun()
+def extinction_message(stats):
+    """Returns why the simulation has to stop, from world.stats(), or None while herbivores and carnivores live."""
+    if stats['Herbivore_Armored']['count'] + stats['Herbivore_Fast']['count'] == 0:
+        return "Simulation Stopped: All herbivores are extinct."
+    if stats['Carnivore_Strong']['count'] + stats['Carnivore_Fast']['count'] == 0:
+        return "Simulation Stopped: All carnivores are extinct."
+    return None
 
-    st.write("---")
-    tick_counter_placeholder = st.empty()
-    tick_counter_placeholder.write(f"**Tick:** {st.session_state.tick}")
-    st.info("Grid Legend:\n\nBlue: All Herbivores\n\nRed: All Carnivores\n\nGreen: Plants")
+def lttb(x, y, points):
+    """
+    Returns the indices of the `points` samples of (x, y) kept by the 
+    Largest-Triangle-Three-Buckets downsampling, `y` holding one series per 
+    column: the first and last samples and, in every bucket between them, 
+    the one making the largest triangle (summed over the series) with the 
+    sample kept before it and the average of the next bucket.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = x.astype(float)
+    y = y.astype(float)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    keep = np.zeros(points, dtype=int)
+    keep[-1] = n - 1
+    a = 0
+    for b in range(points - 2):
+        start, end = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            next_x = x[end:edges[b + 2]].mean()
+            next_y = y[end:edges[b + 2]].mean(axis=0)
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end, None]) * (next_y - y[a])).sum(axis=1)
+        a = start + np.argmax(area)
+        keep[b + 1] = a
+    return keep
 
-col1, col2 = st.columns([1.5, 2])
+class PopulationHistory():
+    """
+    Population counts per tick in bounded memory. The latest HISTORY_SIZE 
+    ticks sit at full resolution in a ring buffer; when it is full its 
+    oldest half is downsampled HISTORY_DOWNSAMPLE times with lttb() into an 
+    archive, itself halved with lttb() whenever it grows past 
+    HISTORY_ARCHIVE points, so older history gets coarser. Written by the 
+    simulation thread and read by the UI.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.ticks = np.zeros(HISTORY_SIZE, dtype=np.int64)
+        self.counts = np.zeros((HISTORY_SIZE, len(columns)), dtype=np.int64)
+        self.start = 0
+        self.size = 0
+        self.archive_ticks = np.zeros(0, dtype=np.int64)
+        self.archive_counts = np.zeros((0, len(columns)), dtype=np.int64)
+        self._lock = threading.Lock()
 
-with col1:
-    st.subheader("Simulation Grid")
-    fig, ax = plt.subplots(figsize=(8, 8))
-    grid_placeholder = st.empty()
+    def append(self, tick, counts):
+        with self._lock:
+            if self.size == HISTORY_SIZE:
+                self._archive(HISTORY_SIZE // 2)
+            i = (self.start + self.size) % HISTORY_SIZE
+            self.ticks[i] = tick
+            self.counts[i] = counts
+            self.size += 1
 
-with col2:
-    st.subheader("Population Trends")
-    line_chart_placeholder = st.empty()
+    def _archive(self, n):
+        """Moves the oldest `n` ticks of the ring buffer into the archive, downsampled."""
+        rows = (self.start + np.arange(n)) % HISTORY_SIZE
+        keep = lttb(self.ticks[rows], self.counts[rows], n // HISTORY_DOWNSAMPLE)
+        self.archive_ticks = np.concatenate([self.archive_ticks, self.ticks[rows[keep]]])
+        self.archive_counts = np.concatenate([self.archive_counts, self.counts[rows[keep]]])
+        if len(self.archive_ticks) > HISTORY_ARCHIVE:
+            keep = lttb(self.archive_ticks, self.archive_counts, HISTORY_ARCHIVE // 2)
+            self.archive_ticks = self.archive_ticks[keep]
+            self.archive_counts = self.archive_counts[keep]
+        self.start = (self.start + n) % HISTORY_SIZE
+        self.size -= n
 
-stats_placeholder = st.empty()
+    def frame(self, since=None):
+        """
+        Returns the history as a DataFrame indexed by Tick, archive 
+        included, or only the full resolution ticks after `since`.
+        """
+        with self._lock:
+            rows = (self.start + np.arange(self.size)) % HISTORY_SIZE
+            ticks, counts = self.ticks[rows], self.counts[rows]
+            if since is None:
+                ticks = np.concatenate([self.archive_ticks, ticks])
+                counts = np.concatenate([self.archive_counts, counts])
+            else:
+                ticks, counts = ticks[ticks > since], counts[ticks > since]
+        return pd.DataFrame(counts, columns=self.columns, index=pd.Index(ticks, name='Tick'))
 
-if st.session_state.running:
-    run_simulation()
-else:
-    ax.clear()
-    ax.imshow(st.session_state.world.create_grid_image(), interpolation='nearest')
-    ax.axis('off')
-    grid_placeholder.pyplot(fig)
-
-    if st.session_state.history:
-        history_df = pd.DataFrame(st.session_state.history).set_index('Tick')
-    else:
-        history_df = pd.DataFrame(columns=['Herb (Armor)', 'Herb (Fast)', 'Carn (Strong)', 'Carn (Fast)'])
-    
-    line_chart_placeholder.line_chart(history_df)
+class RenderBudget():
+    """
+    Splits the time between simulating and drawing. From running averages 
+    of the time a tick and the drawing of a frame take, plan() picks the 
+    frame rate and the ticks advanced per frame that meet the target ticks 
+    and frames per second: frames are skipped first, down to MIN_FPS, and 
+    only then does the simulation fall behind its target.
+    """
+    def __init__(self, target_tps=TICKS_PER_SECOND, target_fps=DISPLAY_FPS):
+        self.target_tps = target_tps
+        self.target_fps = target_fps
+        self.step_time = 0.0
+        self.render_time = 0.0
+
+    def record_step(self, seconds):
+        self.step_time += TIMING_SMOOTHING * (seconds - self.step_time) if self.step_time else seconds
+
+    def record_render(self, seconds):
+        self.render_time += TIMING_SMOOTHING * (seconds - self.render_time) if self.render_time else seconds
+
+    def plan(self, fast=False):
+        """
+        Returns the frames per second to draw and the ticks to advance per 
+        frame, for target_tps ticks per second or, `fast`, as many as the 
+        time left by drawing allows.
+        """
+        if fast:
+            render_share = FAST_RENDER_SHARE
+        else:
+            # The target ticks come first, drawing gets the time they leave
+            render_share = 1 - self.target_tps * self.step_time
+        fps = self.target_fps
+        if self.render_time:
+            fps = min(fps, max(MIN_FPS, render_share / self.render_time))
+        tps = self.target_tps
+        if self.step_time:
+            reachable = max(0, 1 - fps * self.render_time) / self.step_time
+            tps = reachable if fast else min(tps, reachable)
+        return fps, max(1, math.ceil(tps / fps))
+
+class SimulationRunner():
+    """
+    Advances a World in a background thread, at budget.target_tps ticks per 
+    second or as fast as possible, independently of the display. After 
+    every tick it records the population counts and, every so many ticks 
+    as planned by the RenderBudget, publishes a Frame into a bounded queue 
+    the UI drains at its own rate, the oldest Frame making room when the UI 
+    falls behind. While the thread runs only the thread touches the World.
+    """
+    def __init__(self, world):
+        self.world = world
+        # uint8 RGB colour of every grid index
+        self.palette = world.create_grid_image(indexed=True, species_colors=SPECIES_COLORS)[1]
+        self.tick = 0
+        self.history = PopulationHistory(list(HISTORY_SERIES))
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.message = None
+        self.budget = RenderBudget()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, ticks=None):
+        """Runs until stopped, paced at budget.target_tps, or `ticks` ticks as fast as possible."""
+        if self.running:
+            return
+        self.message = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(ticks,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def frame(self, stats=None):
+        """
+        Returns a Frame of the current state of the World, from `stats` if 
+        world.stats() was already taken this tick. The gene maxima go over 
+        the whole population, so they are only computed here, once per frame.
+        """
+        if stats is None:
+            stats = self.world.stats()
+        maxima = self.world.gene_maxima()
+        stats = {name: dict(species_stats, max=maxima[name]) for name, species_stats in stats.items()}
+        return Frame(self.tick, self.world.grid_indices(), stats)
+
+    def publish(self, frame):
+        """Queues a Frame, dropping the oldest one when the queue is full."""
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next_frame(self):
+        """Returns the latest published Frame, dropping the older ones, or None if there is none."""
+        frame = None
+        while True:
+            try:
+                frame = self.frames.get_nowait()
+            except queue.Empty:
+                return frame
+
+    def _run(self, ticks):
+        deadline = time.perf_counter()
+        skipped = 0
+        while not self._stop.is_set() and ticks != 0:
+            started = time.perf_counter()
+            self.world.step()
+            self.tick += 1
+            stats = self.world.stats()
+            self.history.append(self.tick, [stats[name]['count'] for name in HISTORY_SERIES.values()])
+            self.message = extinction_message(stats)
+
+            _, ticks_per_frame = self.budget.plan(fast=ticks is not None)
+            skipped += 1
+            if skipped >= ticks_per_frame or self.message:
+                self.publish(self.frame(stats))
+                skipped = 0
+            self.budget.record_step(time.perf_counter() - started)
+
+            if self.message:
+                break
+            if ticks is None:
+                # A slow tick delays the next ones instead of being caught up in a burst
+                deadline = max(deadline + 1 / self.budget.target_tps, time.perf_counter())
+                self._stop.wait(deadline - time.perf_counter())
+            else:
+                ticks -= 1
+
+def grid_image(frame):
+    """
+    Returns the grid of a Frame as a palette image, each cell a block of 
+    GRID_SCALE x GRID_SCALE pixels, so it stays sharp without matplotlib 
+    and encodes to a small PNG.
+    """
+    image = Image.fromarray(frame.grid)
+    image.putpalette(runner.palette.ravel().tolist())
+    return image.resize((image.width * GRID_SCALE, image.height * GRID_SCALE), Image.NEAREST)
+
+def show_frame(frame):
+    """Draws the grid and stats of a Frame into their placeholders."""
+    grid_placeholder.image(grid_image(frame), output_format='PNG', width='stretch')
 
     with stats_placeholder.container():
-        all_entities = st.session_state.world.all_entities
-        
-        h_armored = [e for e in all_entities if isinstance(e, Herbivore_Armored)]
-        h_fast    = [e for e in all_entities if isinstance(e, Herbivore_Fast)]
-        c_strong  = [e for e in all_entities if isinstance(e, Carnivore_Strong)]
-        c_fast    = [e for e in all_entities if isinstance(e, Carnivore_Fast)]
-        
+        h_armored = frame.stats['Herbivore_Armored']
+        h_fast    = frame.stats['Herbivore_Fast']
+        c_strong  = frame.stats['Carnivore_Strong']
+        c_fast    = frame.stats['Carnivore_Fast']
+
         st.subheader("Population Statistics")
         row1_col1, row1_col2 = st.columns(2)
         with row1_col1:
             st.markdown("### Standard Herbivores")
-            st.metric("Count", len(h_armored))
+            st.metric("Count", h_armored['count'])
             st.dataframe(get_population_stats(h_armored), width='stretch')
         with row1_col2:
             st.markdown("### Light Herbivores")
-            st.metric("Count", len(h_fast))
+            st.metric("Count", h_fast['count'])
             st.dataframe(get_population_stats(h_fast), width='stretch')
 
         st.divider()
 
+        # Row 2: Carnivores
         row2_col1, row2_col2 = st.columns(2)
         with row2_col1:
             st.markdown("### Standard Carnivores")
-            st.metric("Count", len(c_strong))
+            st.metric("Count", c_strong['count'])
             st.dataframe(get_population_stats(c_strong), width='stretch')
         with row2_col2:
             st.markdown("### Light Carnivores")
-            st.metric("Count", len(c_fast))
-            st.dataframe(get_population_stats(c_fast), width='stretch')
\ No newline at end of file
+            st.metric("Count", c_fast['count'])
+            st.dataframe(get_population_stats(c_fast), width='stretch')
+
+    with tick_counter_placeholder.container():
+        frames_per_second, ticks_per_second = display_rates()
+        st.write(f"**Tick:** {frame.tick}")
+        st.write(f"**Ticks/s:** {ticks_per_second:.1f}")
+        st.write(f"**FPS:** {frames_per_second:.1f}")
+
+def show_chart():
+    """Draws the population chart from the whole history, older ticks downsampled."""
+    history_df = runner.history.frame()
+    st.session_state.chart = line_chart_placeholder.line_chart(history_df)
+    st.session_state.chart_tick = history_df.index[-1] if len(history_df) else 0
+    st.session_state.chart_rows = len(history_df)
+
+def update_chart():
+    """
+    Appends the ticks recorded since the last update to the population 
+    chart with add_rows, redrawing it with show_chart() instead once it 
+    holds more than HISTORY_SIZE + HISTORY_ARCHIVE rows.
+    """
+    new_rows = runner.history.frame(since=st.session_state.chart_tick)
+    if new_rows.empty:
+        return
+    if st.session_state.chart_rows + len(new_rows) > HISTORY_SIZE + HISTORY_ARCHIVE:
+        show_chart()
+        return
+    st.session_state.chart.add_rows(new_rows)
+    st.session_state.chart_tick = new_rows.index[-1]
+    st.session_state.chart_rows += len(new_rows)
+
+def live_view():
+    """
+    Shows the newest frame of the running simulation and the new ticks of 
+    the chart, rerun every 1 / budget.target_fps seconds.
+    """
+    frame = runner.next_frame()
+    if not runner.running:
+        # The thread stopped on its own: rerun the whole app to show the final state
+        st.rerun()
+    if frame is not None:
+        started = time.perf_counter()
+        st.session_state.frame_times.append((started, frame.tick))
+        st.session_state.last_frame = frame
+        show_frame(frame)
+        update_chart()
+        runner.budget.record_render(time.perf_counter() - started)
+
+def display_rates():
+    """Returns the frames shown and the ticks they advanced per second, over the last FPS_WINDOW frames."""
+    times = st.session_state.frame_times
+    if len(times) < 2:
+        return 0.0, 0.0
+    (first_time, first_tick), (last_time, last_tick) = times[0], times[-1]
+    return (len(times) - 1) / (last_time - first_time), (last_tick - first_tick) / (last_time - first_time)
+
+
+if 'runner' not in st.session_state:
+    world = World()
+    world.init_population()
+    st.session_state.runner = SimulationRunner(world)
+    st.session_state.last_frame = st.session_state.runner.frame()
+    st.session_state.frame_times = deque(maxlen=FPS_WINDOW)
+runner = st.session_state.runner
+
+with st.sidebar:
+    st.header("Controls")
+    if st.button("Start", key="start", width='stretch'):
+        runner.start()
+    if st.button("Stop", key="stop", width='stretch'):
+        runner.stop()
+    run_ticks = st.number_input("Ticks", min_value=1, value=100, step=100, key="run_ticks")
+    if st.button(f"Run {run_ticks} Ticks", key="run_n", width='stretch', help="as fast as possible, without pacing"):
+        runner.start(ticks=run_ticks)
+    if st.button("Reset World", key="reset", width='stretch'):
+        runner.stop()
+        world = World()
+        world.init_population()
+        st.session_state.runner = SimulationRunner(world)
+        st.session_state.last_frame = st.session_state.runner.frame()
+        st.rerun()
+
+    st.write("---")
+    runner.budget.target_tps = st.slider("Target Ticks/s", min_value=1, max_value=500, value=TICKS_PER_SECOND,
+                                         key="target_tps", help="pace of Start, frames are skipped to keep it")
+    runner.budget.target_fps = st.slider("Target FPS", min_value=1, max_value=DISPLAY_FPS, value=DISPLAY_FPS,
+                                         key="target_fps")
+    tick_counter_placeholder = st.empty()
+    st.info("Grid Legend:\n\nBlue: Armored Herbivores\n\nLight Blue: Fast Herbivores\n\nRed: Strong Carnivores\n\nOrange: Fast Carnivores\n\nGreen: Plants")
+
+
+col1, col2 = st.columns([1.5, 2])
+
+with col1:
+    st.subheader("Simulation Grid")
+    grid_placeholder = st.empty()
+
+with col2:
+    st.subheader("Population Trends")
+    line_chart_placeholder = st.empty()
+
+stats_placeholder = st.empty()
+
+if not runner.running:
+    if runner.message:
+        st.toast(runner.message)
+        runner.message = None
+    st.session_state.last_frame = runner.frame()
+    st.session_state.frame_times.clear()
+show_frame(st.session_state.last_frame)
+show_chart()
+if runner.running:
+    # Updates the placeholders above, the fragment itself draws nothing
+    st.fragment(live_view, run_every=1 / runner.budget.target_fps)()
\ No newline at end of file
@@ -1,6 +1,15 @@
+import argparse
 import csv
+import hashlib
+import json
 import os
+import queue
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
+import config
 import source_baseline
 
 # config
@@ -11,37 +20,270 @@ OUTPUT_DIR = "sim_results_baseline"
 HERB_GENES = ['speed', 'vision', 'sociability', 'armor', 'w_plant', 'w_threat']
 CARN_GENES = ['speed', 'vision', 'sociability', 'strength', 'w_prey', 'w_competition']
 
+# Columns of the sim_{id} files, in order
+COLUMNS = (['step', 'herb_count', 'carn_count']
+           + [f'herb_{gene}_{stat}' for gene in HERB_GENES for stat in ('mean', 'std')]
+           + [f'carn_{gene}_{stat}' for gene in CARN_GENES for stat in ('mean', 'std')])
+# Column prefix of every species, in the time series and in the <prefix>_zero_step columns of the catalog
+SPECIES_PREFIXES = {'Herbivore': 'herb', 'Carnivore': 'carn'}
+# File formats of the sim_{id} files, see RunWriter
+OUTPUT_FORMATS = ('csv', 'npz')
+
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def get_gene_stats(entities, gene_name):
-    """Calculates mean and std for a specific attribute in a list of entities."""
-    if not entities:
-        return 0.0, 0.0
-    
-    values = [getattr(e, gene_name) for e in entities]
-    return np.mean(values), np.std(values)
+def get_gene_stats(species_stats, gene_name):
+    """Returns the mean and std of an attribute from a species entry of world.stats()."""
+    return species_stats['mean'][gene_name], species_stats['std'][gene_name]
+
+def config_hash():
+    """Returns a short hash of the settings in config.py, telling apart the runs made with different ones."""
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+def checksums_path(sim_id):
+    return os.path.join(OUTPUT_DIR, f"checksums_{sim_id}.txt")
+
+def sim_path(sim_id, file_format):
+    return os.path.join(OUTPUT_DIR, f"sim_{sim_id}.{file_format}")
+
+class RunWriter():
+    """
+    Streams the rows of a run to `filename` in chunks of `chunk_size` rows, so 
+    memory does not grow with the number of steps. As CSV, or as an .npz 
+    archive: every chunk of a column is an array, column/0, column/1, ..., 
+    int32 for the step and the counts and float32 for the gene statistics, 
+    and a JSON 'metadata' entry holds `metadata`, the column order and the 
+    number of chunks. Until close() the rows go to filename.tmp (CSV) or to 
+    one .npz per chunk in filename.chunks/, and only then to `filename`, so 
+    a resumed campaign never takes a half-written run for a finished one. 
+    With background=True the chunks are written by a thread while the 
+    simulation goes on. `resume` is a position returned by checkpoint(): 
+    the rows after it are dropped and writing goes on from there.
+    """
+    def __init__(self, filename, columns, file_format, metadata, chunk_size=1000, background=False, resume=None):
+        self.filename = filename
+        self.columns = columns
+        self.file_format = file_format
+        self.metadata = metadata
+        self.chunk_size = chunk_size
+        self.chunks = 0 if resume is None else resume['chunks']
+        self.data = self._new_chunk()
+        self.rows = 0
+        self.error = None
+        if file_format == 'npz':
+            self.file = None
+            self.chunk_dir = filename + ".chunks"
+            if resume is None:
+                shutil.rmtree(self.chunk_dir, ignore_errors=True)
+            os.makedirs(self.chunk_dir, exist_ok=True)
+            for name in os.listdir(self.chunk_dir):
+                if int(name.split('.')[0]) >= self.chunks:
+                    os.remove(os.path.join(self.chunk_dir, name))
+        elif resume is None:
+            self.file = open(filename + ".tmp", 'w', newline='')
+            csv.writer(self.file).writerow(columns)
+        else:
+            self.file = open(filename + ".tmp", 'r+', newline='')
+            self.file.truncate(resume['offset'])
+            self.file.seek(resume['offset'])
+        self.queue = None
+        if background:
+            # At most two chunks wait for the thread, the simulation blocks beyond that
+            self.queue = queue.Queue(maxsize=2)
+            self.thread = threading.Thread(target=self._drain, daemon=True)
+            self.thread.start()
+
+    def _new_chunk(self):
+        return {name: np.zeros(self.chunk_size, dtype=int if name == 'step' or name.endswith('_count') else float)
+                for name in self.columns}
+
+    def append(self, row):
+        """Adds a row, given as a dict of column values."""
+        for name, value in row.items():
+            self.data[name][self.rows] = value
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if self.queue is None:
+            self._write_chunk(self.data, self.rows)
+        else:
+            self.queue.put((self.data, self.rows))
+            # The thread owns the queued chunk, fill a new one
+            self.data = self._new_chunk()
+        self.rows = 0
+
+    def _drain(self):
+        while True:
+            chunk = self.queue.get()
+            # After a failed write the remaining chunks are dropped; close() raises the error
+            if chunk is not None and self.error is None:
+                try:
+                    self._write_chunk(*chunk)
+                except Exception as e:
+                    self.error = e
+            self.queue.task_done()
+            if chunk is None:
+                return
+
+    def _write_chunk(self, data, rows):
+        if self.file_format == 'npz':
+            np.savez(os.path.join(self.chunk_dir, f"{self.chunks}.npz"),
+                     **{name: column[:rows].astype(np.int32 if column.dtype.kind == 'i' else np.float32)
+                        for name, column in data.items()})
+        else:
+            csv.writer(self.file).writerows(zip(*(column[:rows].tolist() for column in data.values())))
+        self.chunks += 1
+
+    def _wait(self):
+        """Waits until the queued chunks are written, raising a failed write."""
+        if self.queue is not None:
+            self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def checkpoint(self):
+        """
+        Writes out the rows so far and returns their position in the file, as 
+        the `resume` of a RunWriter that continues after them.
+        """
+        if self.rows:
+            self._flush()
+        self._wait()
+        if self.file is None:
+            return {'chunks': self.chunks}
+        self.file.flush()
+        return {'chunks': self.chunks, 'offset': self.file.tell()}
+
+    def close(self):
+        """
+        Writes the last rows and moves them to `filename`. A run without rows 
+        leaves no file.
+        """
+        if self.rows:
+            self._flush()
+        if self.queue is not None:
+            self.queue.put(None)
+        self._wait()
+        if self.file is not None:
+            self.file.close()
+            if not self.chunks:
+                os.remove(self.filename + ".tmp")
+                return
+        elif not self.chunks:
+            shutil.rmtree(self.chunk_dir)
+            return
+        else:
+            with zipfile.ZipFile(self.filename + ".tmp", 'w') as archive:
+                for k in range(self.chunks):
+                    with np.load(os.path.join(self.chunk_dir, f"{k}.npz")) as chunk:
+                        for name in self.columns:
+                            with archive.open(f"{name}/{k}.npy", 'w') as f:
+                                np.lib.format.write_array(f, chunk[name])
+                metadata = dict(self.metadata, columns=list(self.columns), chunks=self.chunks)
+                with archive.open("metadata.npy", 'w') as f:
+                    np.lib.format.write_array(f, np.array(json.dumps(metadata)))
+            shutil.rmtree(self.chunk_dir)
+        os.replace(self.filename + ".tmp", self.filename)
+
+def checkpoint_path(sim_id):
+    return os.path.join(OUTPUT_DIR, f"checkpoint_{sim_id}.json")
+
+def load_checkpoint(sim_id):
+    """Returns the last checkpoint of simulation sim_id, or None."""
+    if not os.path.exists(checkpoint_path(sim_id)):
+        return None
+    with open(checkpoint_path(sim_id)) as f:
+        return json.load(f)
+
+def save_checkpoint(sim_id, step, world, output, checksums, zero_steps):
+    """
+    Records a running simulation after `step`: a World snapshot, where its 
+    time series and checksums files stand and the zero steps found so far. 
+    The engine, jit setting and file format are recorded too, see 
+    check_checkpoint(). Every checkpoint has its own snapshot file and 
+    checkpoint_{id}.json, replaced last, points to it, so a run killed at 
+    any moment resumes from a complete checkpoint.
+    """
+    previous = load_checkpoint(sim_id)
+    snapshot = f"checkpoint_{sim_id}_{step}.npz"
+    world.save(os.path.join(OUTPUT_DIR, snapshot))
+    checksums.flush()
+    state = {'step': step, 'snapshot': snapshot, 'output': output.checkpoint(), 'checksums': checksums.tell(),
+             'zero_steps': zero_steps, 'engine': world.engine, 'jit': world.kernels is not None,
+             'format': output.file_format}
+    with open(checkpoint_path(sim_id) + ".tmp", 'w') as f:
+        json.dump(state, f)
+    os.replace(checkpoint_path(sim_id) + ".tmp", checkpoint_path(sim_id))
+    if previous is not None:
+        os.remove(os.path.join(OUTPUT_DIR, previous['snapshot']))
+
+def check_checkpoint(sim_id, engine, jit, file_format):
+    """
+    Raises ValueError if simulation sim_id has a checkpoint written with 
+    another engine, jit setting or file format: its snapshot and half-written 
+    time series only resume with the options of the run that saved them.
+    """
+    checkpoint = load_checkpoint(sim_id)
+    if checkpoint is None:
+        return
+    recorded = (checkpoint['engine'], checkpoint['jit'], checkpoint['format'])
+    if recorded != (engine, jit, file_format):
+        raise ValueError(f"Simulation {sim_id} has a checkpoint of a run with engine={recorded[0]}, "
+                         f"jit={recorded[1]}, format={recorded[2]}; resume it with the same options "
+                         f"or delete {checkpoint_path(sim_id)}")
+
+def remove_checkpoint(sim_id):
+    checkpoint = load_checkpoint(sim_id)
+    if checkpoint is not None:
+        os.remove(os.path.join(OUTPUT_DIR, checkpoint['snapshot']))
+        os.remove(checkpoint_path(sim_id))
 
-def run_single_simulation(sim_id):
-    world = source_baseline.World()
-    world.init_population()
+def run_single_simulation(sim_id, seed, engine='objects', jit=False, file_format='csv', chunk_size=1000,
+                          background_io=False, checkpoint_every=0):
+    check_checkpoint(sim_id, engine, jit, file_format)
+    checkpoint = load_checkpoint(sim_id)
+    if checkpoint is None:
+        world = source_baseline.World(engine=engine, seed=seed, jit=jit)
+        world.init_population()
+        first_step = 0
+        zero_steps = {}
+        # One checksum per tick, for replay()
+        checksums = open(checksums_path(sim_id), 'w')
+    else:
+        # Pick up a killed run after its last checkpoint, with the seed it was started with
+        world = source_baseline.World.load(os.path.join(OUTPUT_DIR, checkpoint['snapshot']))
+        first_step = checkpoint['step'] + 1
+        zero_steps = checkpoint['zero_steps']
+        checksums = open(checksums_path(sim_id), 'r+')
+        checksums.truncate(checkpoint['checksums'])
+        checksums.seek(checkpoint['checksums'])
     
-    sim_data = []
+    metadata = {'sim_id': sim_id, 'seed': world.seed, 'engine': engine, 'jit': jit}
+    output = RunWriter(sim_path(sim_id, file_format), COLUMNS, file_format, metadata, chunk_size, background_io,
+                       resume=checkpoint and checkpoint['output'])
     
-    for step in range(MAX_STEPS):
+    for step in range(first_step, MAX_STEPS):
         world.step()
+        checksums.write(f"{world.checksum()}\n")
+        stats = world.stats()
+        # First step every species is down to 0, for the catalog
+        for name, prefix in SPECIES_PREFIXES.items():
+            if stats[name]['count'] == 0:
+                zero_steps.setdefault(prefix, step)
 
-        herbs = [e for e in world.all_entities if isinstance(e, source_baseline.Herbivore) and not e.is_dead]
-        carns = [e for e in world.all_entities if isinstance(e, source_baseline.Carnivore) and not e.is_dead]
+        herbs, carns = stats['Herbivore'], stats['Carnivore']
 
-        if len(herbs) == 0 or len(carns) == 0:
+        if herbs['count'] == 0 or carns['count'] == 0:
             break
 
         row = {
             'step': step,
-            'herb_count': len(herbs),
-            'carn_count': len(carns)
+            'herb_count': herbs['count'],
+            'carn_count': carns['count']
         }
 
         for gene in HERB_GENES:
@@ -54,37 +296,155 @@ def run_single_simulation(sim_id):
             row[f'carn_{gene}_mean'] = mean
             row[f'carn_{gene}_std'] = std
             
-        sim_data.append(row)
-
-    filename = os.path.join(OUTPUT_DIR, f"sim_{sim_id}.csv")
-    if sim_data:
-        keys = sim_data[0].keys()
-        with open(filename, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(sim_data)
+        output.append(row)
+        if checkpoint_every and (step + 1) % checkpoint_every == 0 and step + 1 < MAX_STEPS:
+            save_checkpoint(sim_id, step, world, output, checksums, zero_steps)
+
+    checksums.close()
+    output.close()
+    remove_checkpoint(sim_id)
             
-    return step, len(herbs), len(carns)
+    return step, herbs['count'], carns['count'], *(zero_steps.get(prefix, '') for prefix in SPECIES_PREFIXES.values()), world.seed
+
+def run_simulations(sim_ids, seeds, workers, **options):
+    """
+    Runs the given simulations, in a pool of `workers` processes when there is 
+    more than one, and yields (sim_id, result of run_single_simulation) as 
+    they finish. The options are passed on to run_single_simulation.
+    """
+    if workers <= 1:
+        for i in sim_ids:
+            yield i, run_single_simulation(i, seeds[i], **options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_single_simulation, i, seeds[i], **options): i for i in sim_ids}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def summary_rows(summary_file):
+    """Returns the rows of the summary by sim_id, none if it does not exist yet."""
+    if not os.path.exists(summary_file):
+        return {}
+    with open(summary_file, newline='') as f:
+        return {int(row['sim_id']): row for row in csv.DictReader(f)}
+
+def finished_simulations(summary_file):
+    """
+    Returns the ids of the finished simulations: those with a summary row. A 
+    sim_{id} file alone does not count, since the row is written afterwards 
+    by the parent process, see discard_orphans().
+    """
+    return set(summary_rows(summary_file))
+
+def discard_orphans(finished):
+    """
+    Removes the sim_{id} files, and any checkpoint, of the simulations not in 
+    `finished`: runs that a worker completed but whose row was never 
+    written, because the campaign was killed in between. Their final counts 
+    and zero steps are not in the time series, so they are run again. 
+    Returns their ids.
+    """
+    orphans = []
+    for i in range(NUM_SIMULATIONS):
+        paths = [sim_path(i, file_format) for file_format in OUTPUT_FORMATS]
+        if i in finished or not any(os.path.exists(path) for path in paths):
+            continue
+        remove_checkpoint(i)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        orphans.append(i)
+    return orphans
+
+def replay(sim_id, engine='objects', jit=False):
+    """
+    Re-runs simulation sim_id from its recorded seed and checks its per-tick 
+    checksums. Raises ValueError if the simulation has no summary row.
+    """
+    summary_file = os.path.join(OUTPUT_DIR, "summary.csv")
+    row = summary_rows(summary_file).get(sim_id)
+    if row is None:
+        raise ValueError(f"Simulation {sim_id} has no row in {summary_file}: it has not finished, "
+                         f"so there is no recorded run to replay")
+    seed = int(row['seed'])
+    with open(checksums_path(sim_id)) as f:
+        checksums = [int(line) for line in f]
+
+    print(f"Replaying Simulation {sim_id} (seed {seed}, {len(checksums)} steps)...")
+    source_baseline.World.replay(seed, checksums, engine=engine, jit=jit)
+    print("Replay matches the recorded run.")
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=None,
+                        help="base seed the seeds of the simulations are spawned from (default: fresh entropy)")
+    parser.add_argument('--replay', type=int, metavar='SIM_ID', default=None,
+                        help="re-run a recorded simulation and check its checksums instead "
+                             "(with the --engine and --jit of the recorded run)")
+    parser.add_argument('--engine', choices=['objects', 'arrays'], default='objects',
+                        help="simulation engine (default: objects)")
+    parser.add_argument('--jit', action='store_true',
+                        help="run the array engine with the Numba kernels (needs --engine arrays)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of simulations run in parallel processes (default: 1)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help="file format of the per-simulation time series (default: csv)")
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="rows held in memory before they are written out (default: 1000)")
+    parser.add_argument('--background-io', action='store_true',
+                        help="write the time series from a background thread, overlapping the simulation")
+    parser.add_argument('--checkpoint-every', type=int, default=500, metavar='STEPS',
+                        help="save a checkpoint of every running simulation each STEPS steps, "
+                             "from which a killed campaign resumes (0 disables, default: 500)")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        try:
+            replay(args.replay, args.engine, args.jit)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+
+    sequence = np.random.SeedSequence(args.seed)
+    # Independent streams: one seed per simulation, spawned from the base seed
+    seeds = [int(child.generate_state(1, np.uint64)[0]) for child in sequence.spawn(NUM_SIMULATIONS)]
     ensure_dir(OUTPUT_DIR)
+    summary_file = os.path.join(OUTPUT_DIR, "summary.csv")
+    finished = finished_simulations(summary_file)
+    orphans = discard_orphans(finished)
+    pending = [i for i in range(NUM_SIMULATIONS) if i not in finished]
+    for i in pending:
+        try:
+            check_checkpoint(i, args.engine, args.jit, args.format)
+        except ValueError as e:
+            parser.error(str(e))
     
     print(f"--- STARTING {NUM_SIMULATIONS} SIMULATIONS ---")
     print(f"Output Directory: ./{OUTPUT_DIR}/")
+    print(f"Base seed: {sequence.entropy}")
+    if finished:
+        print(f"Resuming: {len(finished)} simulations already done")
+    if orphans:
+        print(f"Running again {len(orphans)} simulations that finished without a summary row: {orphans}")
     
-    summary_file = os.path.join(OUTPUT_DIR, "summary.csv")
-    
-    with open(summary_file, 'w', newline='') as f:
+    # Only this process writes the summary, the campaign's catalog: one row per finished run in any order
+    settings = config_hash()
+    with open(summary_file, 'a', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(['sim_id', 'duration_steps', 'final_herb_count', 'final_carn_count'])
+        # An empty summary, new or left by a campaign killed before its first run ended, gets the header
+        if os.path.getsize(summary_file) == 0:
+            writer.writerow(['sim_id', 'duration_steps', 'final_herb_count', 'final_carn_count',
+                             *(f'{prefix}_zero_step' for prefix in SPECIES_PREFIXES.values()), 'seed', 'config_hash'])
+            f.flush()
         
-        for i in range(NUM_SIMULATIONS):
-            print(f"Running Simulation {i+1}/{NUM_SIMULATIONS}...", end="\r")
-            
-            duration, h_end, c_end = run_single_simulation(i)
-            
-            writer.writerow([i, duration, h_end, c_end])
-
+        results = run_simulations(pending, seeds, args.workers, engine=args.engine, jit=args.jit,
+                                  file_format=args.format, chunk_size=args.chunk_size,
+                                  background_io=args.background_io, checkpoint_every=args.checkpoint_every)
+        for done, (i, result) in enumerate(results, 1):
+            print(f"Finished Simulation {i} ({done}/{len(pending)})...", end="\r")
+            # The seed comes with the result: a resumed run keeps the one it was started with
+            writer.writerow([i, *result, settings])
             f.flush()
 
     print(f"\n--- DONE. Data saved to {OUTPUT_DIR} ---")
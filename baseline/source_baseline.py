@@ -1,17 +1,58 @@
-import random
 import config
 import numpy as np
 import math
+import functools
+import json
+import warnings
+import zlib
 
 class World():
-    def __init__(self):
+    # State arrays written as they are by save(), see load()
+    SNAPSHOT_ARRAYS = ('plants', 'counts', 'species_sizes', 'gene_sums', 'gene_squares')
+
+    def __init__(self, engine='objects', seed=None, jit=False):
         """
         Initializes the World environment by creating a grid of Cell objects 
-        according to the dimensions specified in the config, and prepares 
-        an empty registry for all entities.
+        according to the dimensions specified in the config, a DIMxDIM plant 
+        layer seeded with density P_INIT_PLANT, a per-species count grid of 
+        the animals in every cell, and an empty registry for all entities.
+        With engine='arrays' the animals are kept as rows of a Population 
+        (one NumPy column per attribute) instead of Animal objects, and 
+        all_entities stays empty.
+        seed is passed to np.random.default_rng: the same seed and engine 
+        give the same run, tick for tick.
+        jit=True runs the array engine with the Numba kernels (see 
+        jit_kernels); without Numba installed it warns and keeps the NumPy 
+        version.
         """
+        if engine not in ('objects', 'arrays'):
+            raise ValueError(f"Unknown engine: {engine!r}")
+        if jit and engine != 'arrays':
+            raise ValueError("jit=True requires engine='arrays'")
+        self.engine = engine
+        self.kernels = jit_kernels() if jit else None
+        if jit and self.kernels is None:
+            warnings.warn("Numba is not installed, running the NumPy array engine")
+        # Source of every random draw of this world, in both engines
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # Plant layer shared by both engines; Cell.plant reads and writes it
+        self.plants = (self.rng.random((config.DIM, config.DIM)) < config.P_INIT_PLANT).astype(np.int8)
         self.grid = [[Cell(x, y, self) for x in range(config.DIM)] for y in range(config.DIM)]
+        # The cells by flat index (y * DIM + x), for get_neighborhood_cells
+        self.cells = [cell for row in self.grid for cell in row]
         self.all_entities = []
+        # Dead entities still in all_entities, see step()
+        self.tombstones = 0
+        self.population = Population() if engine == 'arrays' else None
+        # Animals per cell and species, indexed [y, x, species id]; Cell.add and Cell.remove keep it current
+        self.counts = np.zeros((config.DIM, config.DIM, len(SPECIES)), dtype=np.int32)
+        # Running totals of the living animals of every species: their number, and the sums and sums of 
+        # squares of every gene column, as floats since genes need not be integers (e.g. the weights 
+        # set in config); updated on every birth and death, see stats()
+        self.species_sizes = np.zeros(len(SPECIES), dtype=np.int64)
+        self.gene_sums = np.zeros((len(SPECIES), len(GENE_COLUMNS)), dtype=float)
+        self.gene_squares = np.zeros((len(SPECIES), len(GENE_COLUMNS)), dtype=float)
     
     def get_cell(self, x, y):
         """
@@ -24,15 +65,68 @@ class World():
     
     def get_neighborhood_cells(self, x, y, radius):
         """
-        Returns a list of all Cell objects situated within a square radius 
+        Returns a tuple of all Cell objects situated within a square radius 
         around the specified (x, y) center point, utilizing toroidal wrapping.
+        The cells are looked up by the row of the center in the shared 
+        neighborhood_table(), so a World keeps no windows of its own.
+        """
+        window = neighborhood_table(radius)[(y % config.DIM) * config.DIM + x % config.DIM]
+        return tuple(map(self.cells.__getitem__, window.tolist()))
+
+    def occupancy(self, kind):
+        """
+        Returns a DIMxDIM array with the number of animals of class `kind` 
+        in every cell, e.g. occupancy(Herbivore) sums all herbivore species.
         """
-        cells = []
-        for dy in range(-radius, radius + 1):
-            for dx in range(-radius, radius + 1):
-                # Using toroidal get_cell logic
-                cells.append(self.get_cell(x + dx, y + dy))
-        return cells
+        return self.counts[..., [issubclass(cls, kind) for cls in SPECIES]].sum(axis=-1)
+
+    def stats(self, world=None):
+        """
+        Returns the number of living animals of every species and the mean 
+        and standard deviation of each of its genes, as {species name: 
+        {'count': n, 'mean': {gene: value}, 'std': {gene: value}}}. 
+        They come from the running totals kept on every birth and death, so 
+        the cost does not grow with the population. The std is the population 
+        one, like np.std, and an extinct species has means and stds of 0.0. 
+        For a WorldEnsemble, `world` picks one of its worlds.
+        """
+        sizes, sums, squares = self.species_sizes, self.gene_sums, self.gene_squares
+        if world is not None:
+            sizes, sums, squares = sizes[world], sums[world], squares[world]
+        n = np.maximum(sizes, 1)[:, None]
+        means = sums / n
+        # Clamped at 0 against rounding when all the values are equal
+        stds = np.sqrt(np.maximum(n * squares - sums**2, 0) / n**2)
+        return {cls.__name__: {'count': int(sizes[k]),
+                               'mean': {gene: float(means[k, g]) for g, gene in enumerate(GENE_COLUMNS) if HAS_GENE[k, g]},
+                               'std': {gene: float(stds[k, g]) for g, gene in enumerate(GENE_COLUMNS) if HAS_GENE[k, g]}}
+                for k, cls in enumerate(SPECIES)}
+
+    def gene_maxima(self, world=None):
+        """
+        Returns the largest value of every gene among the living animals of 
+        every species, as {species name: {gene: value}}, 0 for an extinct 
+        species. Unlike stats() it goes over the whole population, so it is 
+        meant for the ticks that are shown. For a WorldEnsemble, `world` 
+        picks one of its worlds.
+        """
+        population = self.population
+        if population is None:
+            population = Population(len(self.all_entities))
+            population.append_entities([entity for entity in self.all_entities if not entity.is_dead])
+        rows = slice(None) if world is None else population['world'] == world
+        maxima = np.zeros((len(SPECIES), len(GENE_COLUMNS)))
+        for g, gene in enumerate(GENE_COLUMNS):
+            np.maximum.at(maxima[:, g], population['species'][rows], population[gene][rows])
+        return {cls.__name__: {gene: float(maxima[k, g]) for g, gene in enumerate(GENE_COLUMNS) if HAS_GENE[k, g]}
+                for k, cls in enumerate(SPECIES)}
+
+    def _randint(self, low, high):
+        """
+        Returns a random integer N such that low <= N <= high, like 
+        random.randint, drawn from the world's generator.
+        """
+        return int(self.rng.integers(low, high, endpoint=True))
 
     def init_population(self):
         """
@@ -42,16 +136,16 @@ class World():
         # Initialize Herbivores
         for _ in range(config.INIT_HERB):
             while True:
-                x = random.randint(0, config.DIM - 1)
-                y = random.randint(0, config.DIM - 1)
+                x = self._randint(0, config.DIM - 1)
+                y = self._randint(0, config.DIM - 1)
                 cell = self.get_cell(x, y)
                 if not cell.entities:
                     herb = Herbivore(x, y, config.INIT_ENERGY, 
-                                    random.randint(1, config.MAX_INIT_SPEED),
-                                    random.randint(1, config.MAX_INIT_VISION),
-                                    random.randint(1, config.MAX_INIT_SOCIABILITY),
-                                    random.randint(1, config.MAX_INIT_ARMOR),
-                                    config.W_HERB_FOOD_DIRECT, config.W_HERB_THREAT)
+                                    self._randint(1, config.MAX_INIT_SPEED),
+                                    self._randint(1, config.MAX_INIT_VISION),
+                                    self._randint(1, config.MAX_INIT_SOCIABILITY),
+                                    self._randint(1, config.MAX_INIT_ARMOR),
+                                    config.W_HERB_FOOD_DIRECT, config.W_HERB_THREAT, rng=self.rng)
                     cell.add(herb)
                     self.all_entities.append(herb)
                     break
@@ -59,61 +153,75 @@ class World():
         # Initialize Carnivores
         for _ in range(config.INIT_CARN):
             while True:
-                x = random.randint(0, config.DIM - 1)
-                y = random.randint(0, config.DIM - 1)
+                x = self._randint(0, config.DIM - 1)
+                y = self._randint(0, config.DIM - 1)
                 cell = self.get_cell(x, y)
                 if not cell.entities:
                     carn = Carnivore(x, y, config.INIT_ENERGY, 
-                                    random.randint(1, config.MAX_INIT_SPEED), 
-                                    random.randint(1, config.MAX_INIT_VISION),
-                                    random.randint(1, config.MAX_INIT_SOCIABILITY),
-                                    random.randint(1, config.MAX_INIT_STRENGTH),
-                                    config.W_CARN_PREY, config.W_CARN_COMPETITION)
+                                    self._randint(1, config.MAX_INIT_SPEED), 
+                                    self._randint(1, config.MAX_INIT_VISION),
+                                    self._randint(1, config.MAX_INIT_SOCIABILITY),
+                                    self._randint(1, config.MAX_INIT_STRENGTH),
+                                    config.W_CARN_PREY, config.W_CARN_COMPETITION, rng=self.rng)
                     cell.add(carn)
                     self.all_entities.append(carn)
                     break
 
-    def create_grid_image(self):
+        self._tally_entities(self.all_entities, 1)
+        if self.engine == 'arrays':
+            # Placement reuses the Cell occupancy above, then the animals become rows
+            for entity in self.all_entities:
+                self.get_cell(entity.x, entity.y).remove(entity)
+            self.population.append_entities(self.all_entities)
+            self.all_entities = []
+            self._count_rows(np.arange(len(self.population)), 1)
+
+    def create_grid_image(self, indexed=False, species_colors=None, world=None):
         """
         Constructs and returns a 3D NumPy array (RGB) representing the current visual 
         state of the grid, coloring cells based on the presence of ground, plants, 
         herbivores, or carnivores.
+        With indexed=True returns instead the uint8 palette indices of 
+        grid_indices() and the matching (n, 3) uint8 palette. species_colors 
+        optionally maps species classes to their own RGB colour. For a 
+        WorldEnsemble, `world` picks one of its worlds.
         """
-        grid_image = np.full((config.DIM, config.DIM, 3), [0.6, 0.4, 0.2]) # Brown ground
-        for y in range(config.DIM):
-            for x in range(config.DIM):
-                cell = self.get_cell(x,y)
-                if cell.plant:
-                    grid_image[y, x] = [0.2, 0.8, 0.2] # Green grass
-                
-                # Draw entities on top
-                if cell.entities:
-                    entity = cell.entities[0]
-                    if isinstance(entity, Herbivore):
-                        grid_image[y, x] = [0, 0, 1] # Blue Herbivore
-                    elif isinstance(entity, Carnivore):
-                        grid_image[y, x] = [1, 0, 0] # Red Carnivore
-        return grid_image
+        palette = grid_palette(species_colors)
+        if indexed:
+            return self.grid_indices(world), np.round(palette * 255).astype(np.uint8)
+        return palette[self.grid_indices(world)]
+
+    def grid_indices(self, world=None):
+        """
+        Returns a DIMxDIM uint8 array of grid_palette() indices built from the 
+        plant layer and the count grid: 0 for ground, 1 for a plant and 
+        2 + species id where animals stand. Animals are drawn on top of 
+        plants and, within a cell, a later species of SPECIES on top of an 
+        earlier one, so carnivores cover herbivores. For a WorldEnsemble, 
+        `world` picks one of its worlds.
+        """
+        plants, counts = self.plants, self.counts
+        if world is not None:
+            plants, counts = plants[world], counts[world]
+        indices = plants.astype(np.uint8)
+        for k in range(len(SPECIES)):
+            indices[counts[:, :, k] > 0] = 2 + k
+        return indices
     
-    def grow(self, x, y):
-        """
-        Calculates the probability of plant growth for a specific cell based on 
-        logistic-style rules (neighboring plant density) and updates the cell's 
-        plant status if successful.
-        """
-        # Logistic-style growth based on neighbors
-        cell = self.get_cell(x, y)
-        if cell.plant == 0:
-            grow_factor = 0
-            neighbor_cells = self.get_neighborhood_cells(x, y, 1)
-            for n_cell in neighbor_cells:
-                if n_cell.plant:
-                    grow_factor += 1
-            
-            # Probability increases with more plant neighbors
-            chance = config.P_PLANT + (config.P_PLANT_NEIGHBOR_FACTOR * grow_factor)
-            if random.random() < chance:
-                cell.plant = 1
+    def regrow(self):
+        """
+        Grows a plant on every empty cell with probability P_PLANT plus 
+        P_PLANT_NEIGHBOR_FACTOR per plant among its 8 neighbors, in the same 
+        order as a row by row scan (see regrow_layers), with one draw per 
+        cell. With the Numba kernels the scan itself runs compiled, on the 
+        same draws.
+        """
+        plants = self.plants
+        draws = self.rng.random(plants.shape)
+        if self.kernels is not None:
+            self.kernels['regrow'](plants, draws, config.P_PLANT, config.P_PLANT_NEIGHBOR_FACTOR)
+            return
+        regrow_layers(plants, draws)
 
     def step(self):
         """
@@ -124,13 +232,21 @@ class World():
         4. Cleanup: Removing dead entities and registering newborns.
         5. Regrowth: Updating plant life on the grid.
         """
-        random.shuffle(self.all_entities)
+        if self.kernels is not None:
+            return self._step_jit()
+        if self.engine == 'arrays':
+            return self._step_arrays()
+
+        # Visiting order: a random permutation of all_entities, whose tombstones are skipped
+        entities = [self.all_entities[i] for i in self.rng.permutation(len(self.all_entities)).tolist()]
         
         # PLANNING PHASE
+        # Tie-breaks of the whole phase in one draw, one per entity
+        tie_breaks = self.rng.random(len(entities)).tolist()
         planned_moves = []
-        for entity in self.all_entities:
+        for entity, tie_break in zip(entities, tie_breaks):
             if entity.is_dead: continue
-            destination_cell = entity.plan(self)
+            destination_cell = entity.plan(self, tie_break)
             planned_moves.append({'entity': entity, 'destination': destination_cell})
         
         # MOVEMENT PHASE
@@ -153,8 +269,11 @@ class World():
 
         # ACTION PHASE
         newborns = []
+        deaths = []
+        # Draws of the whole phase up front, one row per entity: prey pick, hunt roll, reproduction roll
+        draws = self.rng.random((len(entities), 3)).tolist()
         
-        for entity in self.all_entities:
+        for entity, (pick, roll, birth) in zip(entities, draws):
             if entity.is_dead: continue
 
             # METABOLISM AND AGING
@@ -164,6 +283,7 @@ class World():
             # Death by old age or starvation
             if entity.energy <= 0 or entity.age >= entity.max_life:
                 entity.is_dead = True
+                deaths.append(entity)
                 continue 
 
             # HERBIVORE LOGIC
@@ -178,8 +298,8 @@ class World():
                 
                 # Reproduce
                 if entity.energy >= config.REPRODUCTION_THRESHOLD:
-                    if random.random() < config.P_REPRODUCE_HERB:
-                        child = entity.reproduce_asexual()
+                    if birth < config.P_REPRODUCE_HERB:
+                        child = entity.reproduce_asexual(self.rng)
                         if child: newborns.append(child)
 
             # CARNIVORE LOGIC
@@ -196,75 +316,790 @@ class World():
                             prey_list.append(e)
                 
                 if prey_list:
-                    prey = random.choice(prey_list)
+                    prey = prey_list[int(pick * len(prey_list))]
                     advantage = (entity.strength * entity.energy) 
                     defense = (prey.armor * prey.energy)
                     success_chance = 0.5 + 0.5 * ((advantage - defense) / (advantage + defense))
                     
-                    if random.random() < success_chance:
+                    if roll < success_chance:
                         # Successful hunt, max energy check
                         gained = min(config.ENERGY_PER_PREY, config.MAX_ENERGY - entity.energy)
                         entity.energy += gained
                         prey.is_dead = True
+                        deaths.append(prey)
                         action_taken = True
                     else:
                         # Failed hunt
                         entity.energy -= config.ENERGY_HUNT_COST
                 # Reproduce
                 if not action_taken and entity.energy >= config.REPRODUCTION_THRESHOLD:
-                    if random.random() < config.P_REPRODUCE_CARN:
-                        child = entity.reproduce_asexual()
+                    if birth < config.P_REPRODUCE_CARN:
+                        child = entity.reproduce_asexual(self.rng)
                         if child: newborns.append(child)
 
         # CLEANUP
-        survivors = []
-        for entity in self.all_entities:
-            if not entity.is_dead:
-                survivors.append(entity)
-            else:
-                self.get_cell(entity.x, entity.y).remove(entity)
-        
-        self.all_entities = survivors
+        # The dead leave their cells but stay in all_entities as tombstones 
+        # (is_dead) until they make up a quarter of it, then go all at once
+        for entity in deaths:
+            self.get_cell(entity.x, entity.y).remove(entity)
+        self._tally_entities(deaths, -1)
+        self.tombstones += len(deaths)
+        if self.tombstones * 4 > len(self.all_entities):
+            self.all_entities = [entity for entity in self.all_entities if not entity.is_dead]
+            self.tombstones = 0
+
         # Add newborns
         for child in newborns:
             self.get_cell(child.x, child.y).add(child)
-            self.all_entities.append(child)
+        self._tally_entities(newborns, 1)
+        self.all_entities.extend(newborns)
             
         # REGROWTH
-        for y in range(config.DIM):
-            for x in range(config.DIM):
-                self.grow(x,y)
+        self.regrow()
+
+    def checksum(self, world=None):
+        """
+        Returns a 32-bit checksum of the world's state: the plant layer, the 
+        animals per cell and species, and the energy and age totals of every 
+        species. Recorded after every tick, it lets replay() check that a run 
+        is reproduced exactly. For a WorldEnsemble, `world` picks one of its 
+        worlds.
+        """
+        plants, counts = self.plants, self.counts
+        totals = np.zeros((len(SPECIES), 2), dtype=np.int64)
+        if self.engine == 'arrays':
+            pop = self.population
+            rows = slice(None)
+            if world is not None:
+                plants, counts, rows = plants[world], counts[world], pop['world'] == world
+            for column, name in enumerate(('energy', 'age')):
+                totals[:, column] = np.bincount(pop['species'][rows], weights=pop[name][rows], minlength=len(SPECIES))
+        else:
+            for entity in self.all_entities:
+                if entity.is_dead: continue
+                k = SPECIES_INDEX[type(entity)]
+                totals[k, 0] += entity.energy
+                totals[k, 1] += entity.age
+        checksum = zlib.crc32(np.ascontiguousarray(plants).tobytes())
+        checksum = zlib.crc32(np.ascontiguousarray(counts).tobytes(), checksum)
+        return zlib.crc32(totals.tobytes(), checksum)
+
+    @classmethod
+    def replay(cls, seed, checksums, engine='objects', jit=False):
+        """
+        Re-runs a recorded simulation: builds a World with the same seed, 
+        engine and jit setting, populates it and steps it once per recorded checksum, comparing 
+        checksum() after every tick. Raises RuntimeError at the first tick 
+        that differs, otherwise returns the replayed World.
+        """
+        world = cls(engine=engine, seed=seed, jit=jit)
+        world.init_population()
+        for tick, expected in enumerate(checksums):
+            world.step()
+            actual = world.checksum()
+            if actual != expected:
+                raise RuntimeError(f"Replay diverged at tick {tick}: checksum {actual}, recorded {expected}")
+        return world
+
+    def save(self, path):
+        """
+        Writes a snapshot of the world to `path`, an .npz archive versioned by 
+        SNAPSHOT_VERSION: the SNAPSHOT_ARRAYS, the animals as Population 
+        columns and the state of the generator. Animal objects are stored as 
+        rows too, in the order of all_entities (tombstones included) and with 
+        their arrival order in their cells, so that a world from load() goes 
+        on exactly like the saved one.
+        """
+        arrays = {name: getattr(self, name) for name in self.SNAPSHOT_ARRAYS}
+        population = self.population
+        if population is None:
+            population = Population(len(self.all_entities))
+            population.append_entities(self.all_entities)
+            arrival = {entity: k for k, entity in enumerate(e for row in self.grid for cell in row for e in cell.entities)}
+            arrays['arrival'] = np.array([arrival.get(entity, -1) for entity in self.all_entities], dtype=np.int64)
+        arrays.update({f"population/{name}": population[name] for name in population.data})
+        metadata = {'version': SNAPSHOT_VERSION, 'args': self._snapshot_args(), 'rng': self.rng.bit_generator.state}
+        with open(path, 'wb') as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata, default=int)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the world saved by save() at `path`, in the state it was saved 
+        in. Raises ValueError for a snapshot of another format version.
+        """
+        with np.load(path) as snapshot:
+            metadata = json.loads(snapshot['metadata'].item())
+            if metadata['version'] != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version {metadata['version']}, expected {SNAPSHOT_VERSION}")
+            world = cls(**metadata['args'])
+            world.rng.bit_generator.state = metadata['rng']
+            for name in cls.SNAPSHOT_ARRAYS:
+                getattr(world, name)[...] = snapshot[name]
+            population = Population(0)
+            population.append(**{name: snapshot[f"population/{name}"] for name in population.data})
+            arrival = snapshot['arrival'] if world.population is None else None
+
+        if world.population is not None:
+            world.population = population
+            return world
+        world.all_entities = population.to_entities()
+        world.tombstones = int(np.count_nonzero(population['is_dead']))
+        # Cell.add counts the animals again, in the cells' arrival order
+        world.counts[...] = 0
+        for i in np.argsort(arrival).tolist():
+            entity = world.all_entities[i]
+            if not entity.is_dead:
+                world.get_cell(entity.x, entity.y).add(entity)
+        return world
+
+    def _snapshot_args(self):
+        """
+        Returns the constructor arguments load() rebuilds the world with.
+        """
+        return {'engine': self.engine, 'seed': self.seed, 'jit': self.kernels is not None}
+
+    def _step_arrays(self):
+        """
+        Array engine version of step(), applying the same rules to the 
+        population columns. Unlike the object engine, the action phase runs as 
+        consecutive sub-phases over the shuffled order (metabolism, herbivore 
+        grazing and reproduction, hunting, carnivore reproduction) instead of 
+        one animal at a time; hunters still see each prey as it was at their 
+        own turn. The plant of prey killed before its own turn goes to the 
+        next herbivore of the cell, as in the object engine, but hunters 
+        that attacked that herbivore after its turn saw it before that meal.
+        """
+        pop = self.population
+        order = self.rng.permutation(len(pop))
+
+        # PLANNING PHASE
+        dest_x, dest_y = self._plan_arrays()
+
+        # MOVEMENT PHASE
+        x, y, energy = pop['x'], pop['y'], pop['energy']
+        cost = (np.sqrt((x - dest_x)**2 + (y - dest_y)**2) * config.ENERGY_MOVE_COST).astype(np.int64)
+        # Too tired to move, stay put
+        moving = ((dest_x != x) | (dest_y != y)) & (energy > cost)
+        self._count_rows(moving, -1)
+        x[moving] = dest_x[moving]
+        y[moving] = dest_y[moving]
+        self._count_rows(moving, 1)
+        energy[moving] -= cost[moving]
+
+        # ACTION PHASE
+        rank = np.empty(len(pop), dtype=np.int64)
+        rank[order] = np.arange(len(pop))
+        energy_before = energy.copy()
+
+        # METABOLISM AND AGING
+        age, is_dead = pop['age'], pop['is_dead']
+        age += 1
+        energy -= config.ENERGY_IDLE_COST
+        # Death by old age or starvation
+        starved = (energy <= 0) | (age >= pop['max_life'])
+        is_dead |= starved
+
+        # HERBIVORE LOGIC
+        herbivore = IS_HERBIVORE[pop['species']]
+        grazed = self._graze_arrays(order, herbivore)
+        child_energy = np.zeros(len(pop), dtype=np.int64)
+        herb_rolls = self._roll_reproduction(herbivore & ~is_dead, config.P_REPRODUCE_HERB, child_energy)
+
+        # CARNIVORE LOGIC
+        caught, killed_early = self._hunt_arrays(order, rank, herbivore, starved, energy_before)
+        # Prey caught before its own turn never got to graze or reproduce
+        self._regraze_arrays(order, herbivore, starved, killed_early, grazed, herb_rolls, child_energy)
+        child_energy[killed_early] = 0
+        self._roll_reproduction(~herbivore & ~is_dead & ~caught, config.P_REPRODUCE_CARN, child_energy)
+        parents = order[child_energy[order] > 0]
+        newborns = self._offspring(parents, child_energy)
+
+        # CLEANUP
+        self._count_rows(is_dead, -1)
+        self._tally_rows(is_dead, -1)
+        pop.keep(~is_dead)
+        pop.append(**newborns)
+        self._count_rows(np.arange(len(pop) - len(parents), len(pop)), 1)
+        self._tally_rows(np.arange(len(pop) - len(parents), len(pop)), 1)
+
+        # REGROWTH
+        self.regrow()
+
+    def _step_jit(self):
+        """
+        Array engine version of step() running on the Numba kernels. 
+        Planning, movement and the action phase go one animal at a time in 
+        the order of the object engine, compiled, and the dead leave the count 
+        grid as they die. Random numbers are drawn in the same order as in 
+        _step_arrays.
+        """
+        pop, kernels = self.population, self.kernels
+        order = self.rng.permutation(len(pop))
+        x, y, energy, age = pop['x'], pop['y'], pop['energy'], pop['age']
+        herbivore = IS_HERBIVORE[pop['species']]
+        plants, counts = self.plants.reshape(-1), self.counts.reshape(-1)
+
+        # PLANNING PHASE
+        tie_breaks = self.rng.random(len(pop))
+        dest_x, dest_y = np.empty_like(x), np.empty_like(y)
+        kernels['plan'](plants, self.occupancy(Herbivore).reshape(-1), self.occupancy(Carnivore).reshape(-1),
+                        x, y, pop['speed'], pop['vision'], pop['sociability'], herbivore,
+                        pop['w_plant'], pop['w_threat'], pop['w_prey'], pop['w_competition'],
+                        tie_breaks, config.DIM, dest_x, dest_y)
+
+        # MOVEMENT PHASE
+        kernels['move'](x, y, energy, pop['species'], dest_x, dest_y, counts, len(SPECIES),
+                        config.DIM, config.ENERGY_MOVE_COST)
+
+        # ACTION PHASE
+        herb_rolls = self.rng.random(len(pop))
+        # One pair of hunt draws per carnivore that survives its metabolism
+        hunters = np.count_nonzero(~herbivore & (energy > config.ENERGY_IDLE_COST) & (age + 1 < pop['max_life']))
+        hunt_draws = self.rng.random((hunters, 2))
+        carn_rolls = self.rng.random(len(pop))
+        # Herbivore rows grouped by cell, in row order: the rows in cell c are 
+        # herb_rows[herb_start[c]:herb_start[c + 1]]
+        herb_rows = np.flatnonzero(herbivore)
+        cells = y[herb_rows] * config.DIM + x[herb_rows]
+        herb_rows = herb_rows[np.argsort(cells, kind='stable')]
+        herb_start = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=config.DIM**2))))
+        armor = pop['armor']
+        child_energy = np.zeros(len(pop), dtype=np.int64)
+        kernels['action'](order, x, y, energy, age, pop['max_life'], pop['is_dead'], pop['species'], herbivore,
+                          pop['strength'], armor, plants, counts, len(SPECIES), config.DIM, herb_start, herb_rows,
+                          herb_rolls, hunt_draws, carn_rolls, child_energy,
+                          config.ENERGY_IDLE_COST, config.ENERGY_PER_PLANT, config.ENERGY_PER_PREY,
+                          config.ENERGY_HUNT_COST, config.MAX_ENERGY, config.REPRODUCTION_THRESHOLD,
+                          config.P_REPRODUCE_HERB, config.P_REPRODUCE_CARN)
+        parents = order[child_energy[order] > 0]
+        newborns = self._offspring(parents, child_energy)
+
+        # CLEANUP
+        self._tally_rows(pop['is_dead'], -1)
+        pop.keep(~pop['is_dead'])
+        pop.append(**newborns)
+        self._count_rows(np.arange(len(pop) - len(parents), len(pop)), 1)
+        self._tally_rows(np.arange(len(pop) - len(parents), len(pop)), 1)
+
+        # REGROWTH
+        self.regrow()
+
+    def _count_rows(self, rows, change):
+        """
+        Adds `change` to the count grid for each of the given population 
+        rows (an index array or a mask), at the row's current position.
+        """
+        pop = self.population
+        counts = self.counts.reshape(-1)
+        keys = flat_cells(pop['world'][rows], pop['x'][rows], pop['y'][rows]) * len(SPECIES) + pop['species'][rows]
+        counts += change * np.bincount(keys, minlength=counts.size).astype(counts.dtype)
+
+    def _tally(self, world, species, genes, change):
+        """
+        Adds `change` animals to the running species totals for each of the 
+        given animals, genes being their (animals, GENE_COLUMNS) values.
+        """
+        keys = np.asarray(world) * len(SPECIES) + species
+        np.add.at(self.species_sizes.reshape(-1), keys, change)
+        np.add.at(self.gene_sums.reshape(-1, len(GENE_COLUMNS)), keys, change * genes)
+        np.add.at(self.gene_squares.reshape(-1, len(GENE_COLUMNS)), keys, change * genes**2)
+
+    def _tally_entities(self, entities, change):
+        """
+        _tally() for a list of Animal objects. Genes an animal does not have 
+        count as 0.
+        """
+        if not entities:
+            return
+        species = np.array([SPECIES_INDEX[type(e)] for e in entities])
+        genes = np.array([[getattr(e, gene, 0) for gene in GENE_COLUMNS] for e in entities], dtype=float)
+        self._tally(0, species, genes, change)
+
+    def _tally_rows(self, rows, change):
+        """
+        _tally() for the given population rows (an index array or a mask).
+        """
+        pop = self.population
+        genes = np.stack([pop[gene][rows] for gene in GENE_COLUMNS], axis=1)
+        self._tally(pop['world'][rows], pop['species'][rows], genes, change)
+
+    def _plan_arrays(self):
+        """
+        Chooses the destination (x, y) of every row with the rules of 
+        Herbivore.plan and Carnivore.plan. Herbivores sharing the same speed 
+        and vision, or carnivores sharing them, are planned together as one batch.
+        """
+        pop = self.population
+        herbivore = IS_HERBIVORE[pop['species']]
+        tie_breaks = self.rng.random(len(pop))
+        dest_x, dest_y = pop['x'].copy(), pop['y'].copy()
+
+        herbs = self.occupancy(Herbivore).reshape(-1)
+        carns = self.occupancy(Carnivore).reshape(-1)
+        for speed, vision, rows in self._genotype_groups(np.flatnonzero(herbivore)):
+            dest_x[rows], dest_y[rows] = self._plan_herbivores(rows, speed, vision, herbs, carns, tie_breaks[rows])
+        for speed, vision, rows in self._genotype_groups(np.flatnonzero(~herbivore)):
+            dest_x[rows], dest_y[rows] = self._plan_carnivores(rows, speed, vision, herbs, carns, tie_breaks[rows])
+        return dest_x, dest_y
+
+    def _genotype_groups(self, rows):
+        """
+        Splits rows into groups of equal speed and vision and yields 
+        (speed, vision, rows of the group) for each of them.
+        """
+        pop = self.population
+        speed, vision = pop['speed'][rows], pop['vision'][rows]
+        # One integer key per genotype, ordered like (speed, vision) pairs
+        keys = speed * (int(vision.max(initial=0)) + 1) + vision
+        sorter = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[sorter], prepend=-1, append=-1)).tolist()
+        for start, stop in zip(bounds, bounds[1:]):
+            first = sorter[start]
+            yield int(speed[first]), int(vision[first]), rows[sorter[start:stop]]
+
+    def _plan_herbivores(self, rows, speed, vision, herbs, carns, tie_breaks):
+        """
+        Batched Herbivore.plan for herbivores sharing speed and vision: every 
+        move cell of every herbivore is scored at once from the plant layer 
+        and the per-cell herbivore and carnivore counts. Returns the chosen 
+        destinations (x, y).
+        """
+        pop = self.population
+        world, x, y = pop['world'][rows], pop['x'][rows], pop['y'][rows]
+        w_plant = pop['w_plant'][rows][:, None]
+        w_threat = pop['w_threat'][rows][:, None]
+        sociability = pop['sociability'][rows][:, None]
+        moves = window_cells(x, y, speed, world)
+        visible = window_cells(x, y, vision, world)
+        plants = self.plants.reshape(-1)
+        plant_field, threat_field = inverse_square_sums(x, y, speed, vision, plants[visible], carns[visible])
+
+        # FOOD ATTRACTION
+        score = np.where(plants[moves] > 0, w_plant, (w_plant * 0.5) * plant_field)
+
+        # THREAT AVOIDANCE
+        score -= w_threat * threat_field
+
+        # HERDING
+        herd_count = herbs[moves] - (moves == flat_cells(world, x, y)[:, None])
+        score += herd_count * (sociability - 1)
+
+        destination = moves[np.arange(len(rows)), pick_best(score, tie_breaks)]
+        return destination % config.DIM, destination // config.DIM % config.DIM
+
+    def _plan_carnivores(self, rows, speed, vision, herbs, carns, tie_breaks):
+        """
+        Batched Carnivore.plan for carnivores sharing speed and vision: every 
+        move cell of every carnivore is scored at once from the per-cell 
+        herbivore and carnivore counts. Returns the chosen destinations (x, y).
+        """
+        pop = self.population
+        world, x, y = pop['world'][rows], pop['x'][rows], pop['y'][rows]
+        w_prey = pop['w_prey'][rows][:, None]
+        w_competition = pop['w_competition'][rows][:, None]
+        sociability = pop['sociability'][rows][:, None]
+        moves = window_cells(x, y, speed, world)
+        visible = window_cells(x, y, vision, world)
+        rivals = carns[visible]
+        # A carnivore does not compete with itself
+        rivals[:, len(rivals[0]) // 2] -= 1
+        prey_field, competition_field = inverse_square_sums(x, y, speed, vision, herbs[visible], rivals)
+
+        # PREY ATTRACTION
+        score = w_prey * prey_field
+
+        # COMPETITION AVOIDANCE
+        score -= (w_competition * (1 / sociability)) * competition_field
+
+        destination = moves[np.arange(len(rows)), pick_best(score, tie_breaks)]
+        return destination % config.DIM, destination // config.DIM % config.DIM
+
+    def _graze_arrays(self, order, herbivore):
+        """
+        Live herbivores eat the plant of their cell, first come first served 
+        in the shuffled order. Returns a mask of the herbivores that ate.
+        """
+        pop = self.population
+        energy = pop['energy']
+        grazers = order[(herbivore & ~pop['is_dead'])[order]]
+        cells = flat_cells(pop['world'][grazers], pop['x'][grazers], pop['y'][grazers])
+        plants = self.plants.reshape(-1)
+        on_plant = plants[cells] > 0
+        grazers, cells = grazers[on_plant], cells[on_plant]
+        # The first grazer of each cell in the shuffled order gets the plant
+        cells, first = np.unique(cells, return_index=True)
+        eaters = grazers[first]
+
+        # Don't exceed max energy
+        energy[eaters] += np.minimum(config.ENERGY_PER_PLANT, config.MAX_ENERGY - energy[eaters])
+        plants[cells] = 0
+        grazed = np.zeros(len(pop), dtype=bool)
+        grazed[eaters] = True
+        return grazed
+
+    def _regraze_arrays(self, order, herbivore, starved, killed_early, grazed, rolls, child_energy):
+        """
+        Gives the plants grazed by prey killed before its own turn to the 
+        next herbivore of the cell in the shuffled order that was alive at 
+        its turn, or back to the cell if there is none. The new eaters roll 
+        their reproduction again after the meal, with their draws in rolls.
+        """
+        pop = self.population
+        energy = pop['energy']
+        cells = flat_cells(pop['world'], pop['x'], pop['y'])
+        lost = np.unique(cells[grazed & killed_early])
+        if not len(lost):
+            return
+        plants = self.plants.reshape(-1)
+        plants[lost] = 1
+        grazers = order[(herbivore & ~starved & ~killed_early)[order]]
+        grazers = grazers[np.isin(cells[grazers], lost)]
+        # The first of them in each cell comes after the killed grazer, which was the first one alive
+        _, first = np.unique(cells[grazers], return_index=True)
+        eaters = grazers[first]
+
+        # Undo the reproduction rolled before the meal
+        energy[eaters] += child_energy[eaters]
+        child_energy[eaters] = 0
+        # Don't exceed max energy
+        energy[eaters] += np.minimum(config.ENERGY_PER_PLANT, config.MAX_ENERGY - energy[eaters])
+        plants[cells[eaters]] = 0
+        parents = eaters[(energy[eaters] >= config.REPRODUCTION_THRESHOLD) & (rolls[eaters] < config.P_REPRODUCE_HERB)]
+        child_energy[parents] = energy[parents] // 2
+        energy[parents] -= child_energy[parents]
+
+    def _roll_reproduction(self, candidates, chance, child_energy):
+        """
+        Rolls reproduction for the candidates above the energy threshold. 
+        Parents hand half their energy over, recorded in child_energy. 
+        Returns the draws, one per row.
+        """
+        energy = self.population['energy']
+        rolls = self.rng.random(len(energy))
+        parents = candidates & (energy >= config.REPRODUCTION_THRESHOLD) & (rolls < chance)
+        cost = energy[parents] // 2
+        energy[parents] -= cost
+        child_energy[parents] = cost
+        return rolls
+
+    def _hunt_arrays(self, order, rank, herbivore, starved, energy_before):
+        """
+        Live carnivores, in the shuffled order, attack a random herbivore 
+        within radius 1. Every hunter sees its prey as it was at the hunter's 
+        turn: herbivores ranked later have not paid their idle cost, grazed 
+        or died of old age yet, and prey killed earlier in the tick is gone.
+        Hunts are resolved in rounds: all hunters that share no candidate 
+        prey with an earlier unresolved hunter go together, until the rounds 
+        get small and the rest go in order.
+        Returns the mask of carnivores that fed and the mask of herbivores 
+        killed before their own turn.
+        """
+        pop = self.population
+        energy, strength, armor = pop['energy'], pop['strength'], pop['armor']
+        cells = flat_cells(pop['world'], pop['x'], pop['y'])
+
+        hunters = order[(~herbivore & ~pop['is_dead'])[order]]
+        draws = self.rng.random((len(hunters), 2))
+        neighborhoods = window_cells(pop['x'][hunters], pop['y'][hunters], 1, pop['world'][hunters])
+        # Hunters with no herbivore within radius 1 (alive or not) cannot catch anything
+        near_prey = self.occupancy(Herbivore).reshape(-1)[neighborhoods].sum(axis=1) > 0
+        hunters, draws, neighborhoods = hunters[near_prey], draws[near_prey], neighborhoods[near_prey]
+
+        # Candidate prey of every hunter, in the order of its neighborhood cells: 
+        # entries (owner, candidate) with owner the hunter's position in the order
+        prey_rows = np.flatnonzero(herbivore)
+        prey_rows = prey_rows[np.argsort(cells[prey_rows], kind='stable')]
+        prey_count = np.bincount(cells[prey_rows], minlength=self.plants.size)
+        around = neighborhoods.reshape(-1)
+        cell_counts = prey_count[around]
+        owner = np.repeat(np.arange(len(around)) // neighborhoods.shape[1], cell_counts)
+        offset = np.arange(len(owner)) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+        candidates = prey_rows[np.repeat((np.cumsum(prey_count) - prey_count)[around], cell_counts) + offset]
+        # Herbivores that starved before the hunter's turn are not prey
+        visible = (rank[candidates] > rank[hunters[owner]]) | ~starved[candidates]
+        owner, candidates = owner[visible], candidates[visible]
+
+        killed = np.zeros(len(pop), dtype=bool)
+        caught = np.zeros(len(pop), dtype=bool)
+        killed_early = np.zeros(len(pop), dtype=bool)
+        claim = np.empty(len(pop), dtype=np.int64)
+        while len(owner):
+            # A hunter can go once no earlier pending hunter shares a candidate with it
+            claim[candidates[::-1]] = owner[::-1]
+            waiting = np.zeros(len(hunters), dtype=bool)
+            waiting[owner[claim[candidates] != owner]] = True
+            turn = ~waiting[owner]
+            turns = np.flatnonzero(np.bincount(owner[turn], minlength=len(hunters)))
+            # Small rounds cost more than the loop below
+            if len(turns) < 32:
+                break
+            available = turn & ~killed[candidates]
+            prey_total = np.bincount(owner[available], minlength=len(hunters))[turns]
+            pick = (draws[turns, 0] * prey_total).astype(np.int64)
+            hunting = prey_total > 0
+            prey = candidates[available][(np.cumsum(prey_total) - prey_total + pick)[hunting]]
+            hunter, roll = hunters[turns][hunting], draws[turns, 1][hunting]
+            owner, candidates = owner[~turn], candidates[~turn]
+
+            prey_energy = np.where(rank[prey] > rank[hunter], energy_before[prey], energy[prey])
+            advantage = (strength[hunter] * energy[hunter])
+            defense = (armor[prey] * prey_energy)
+            success_chance = 0.5 + 0.5 * ((advantage - defense) / (advantage + defense))
+            success = roll < success_chance
+
+            # Successful hunt, max energy check
+            fed, meal = hunter[success], prey[success]
+            energy[fed] += np.minimum(config.ENERGY_PER_PREY, config.MAX_ENERGY - energy[fed])
+            killed[meal] = True
+            caught[fed] = True
+            killed_early[meal] = rank[meal] > rank[fed]
+            # Failed hunt
+            energy[hunter[~success]] -= config.ENERGY_HUNT_COST
+
+        # Long chains of hunters sharing prey are cheaper one at a time
+        starts = np.flatnonzero(np.diff(owner, prepend=-1)).tolist()
+        turns, pools = owner[starts].tolist(), candidates.tolist()
+        rows, ranks, dead = hunters.tolist(), rank.tolist(), killed.tolist()
+        energies, energies_before = energy.tolist(), energy_before.tolist()
+        strengths, armors = strength.tolist(), armor.tolist()
+        for turn, start, stop in zip(turns, starts, starts[1:] + [len(pools)]):
+            prey_list = [j for j in pools[start:stop] if not dead[j]]
+            if prey_list:
+                i = rows[turn]
+                prey = prey_list[int(draws[turn, 0] * len(prey_list))]
+                prey_energy = energies_before[prey] if ranks[prey] > ranks[i] else energies[prey]
+                advantage = (strengths[i] * energies[i])
+                defense = (armors[prey] * prey_energy)
+                success_chance = 0.5 + 0.5 * ((advantage - defense) / (advantage + defense))
+
+                if draws[turn, 1] < success_chance:
+                    # Successful hunt, max energy check
+                    energies[i] += min(config.ENERGY_PER_PREY, config.MAX_ENERGY - energies[i])
+                    dead[prey] = True
+                    caught[i] = True
+                    killed_early[prey] = ranks[prey] > ranks[i]
+                else:
+                    # Failed hunt
+                    energies[i] -= config.ENERGY_HUNT_COST
+        energy[:] = energies
+        killed[:] = dead
+
+        is_dead = pop['is_dead']
+        is_dead |= killed
+        return caught, killed_early
+
+    def _offspring(self, parents, child_energy):
+        """
+        Returns the columns of the children of `parents` (in that order): 
+        they inherit world, position, species and genes, with each gene mutated by 
+        +/-1 with probability P_MUTATION.
+        """
+        pop = self.population
+        child = {name: pop[name][parents] for name in ('world', 'x', 'y', 'species')}
+        child['energy'] = child_energy[parents]
+        child['max_life'] = self.rng.integers(config.MIN_LIFESPAN, config.MAX_LIFESPAN, len(parents), endpoint=True)
+
+        species = child['species']
+        genes = np.stack([pop[gene][parents] for gene in GENE_COLUMNS], axis=1)
+        flips = (self.rng.random(genes.shape) < config.P_MUTATION) & HAS_GENE[species]
+        change = np.where(self.rng.random(genes.shape) < 0.5, -1, 1)
+        mutated = np.clip(genes + change, GENE_MIN[species], GENE_MAX[species])
+        genes = np.where(flips, mutated, genes)
+        for k, gene in enumerate(GENE_COLUMNS):
+            child[gene] = genes[:, k]
+        return child
+
+class WorldEnsemble():
+    """
+    Independent worlds stepped together by the array engine, so that every 
+    phase of a tick is a few large array operations instead of a set of 
+    small ones per world. The plant layers are stacked into a (size, DIM, 
+    DIM) array, the count grids into (size, DIM, DIM, species), and the 
+    animals of all worlds share one Population, told apart by its world 
+    column. A world ends, and is masked out of active, once its herbivores 
+    or its carnivores are gone.
+    A WorldEnsemble is not a World: it has no Cell grid, and only borrows 
+    the array engine and the snapshot methods of World, which work on the 
+    stacked arrays as they are. stats(), gene_maxima(), grid_indices(), 
+    create_grid_image() and checksum() take the index of the world they 
+    are about.
+    """
+    SNAPSHOT_ARRAYS = World.SNAPSHOT_ARRAYS + ('active', 'ticks')
+
+    def __init__(self, size, seed=None):
+        """
+        Creates `size` empty worlds; init_population() sets them up. World k 
+        starts like World(engine='arrays', seed=s) with s the k-th seed 
+        spawned from `seed`; the ticks then draw from one generator shared 
+        by the whole ensemble.
+        """
+        sequence = np.random.SeedSequence(seed)
+        self.seeds = sequence.spawn(size)
+        self.engine = 'arrays'
+        self.kernels = None
+        self.seed = seed
+        self.rng = np.random.default_rng(sequence)
+        self.plants = np.zeros((size, config.DIM, config.DIM), dtype=np.int8)
+        self.population = Population()
+        self.counts = np.zeros((size, config.DIM, config.DIM, len(SPECIES)), dtype=np.int32)
+        self.species_sizes = np.zeros((size, len(SPECIES)), dtype=np.int64)
+        self.gene_sums = np.zeros((size, len(SPECIES), len(GENE_COLUMNS)), dtype=float)
+        self.gene_squares = np.zeros((size, len(SPECIES), len(GENE_COLUMNS)), dtype=float)
+        # Worlds still running, and the number of ticks every world ran
+        self.active = np.ones(size, dtype=bool)
+        self.ticks = np.zeros(size, dtype=np.int64)
+
+    # The array engine and the snapshots of World, on the stacked arrays
+    occupancy = World.occupancy
+    _step_arrays = World._step_arrays
+    _count_rows = World._count_rows
+    _tally = World._tally
+    _tally_rows = World._tally_rows
+    _plan_arrays = World._plan_arrays
+    _genotype_groups = World._genotype_groups
+    _plan_herbivores = World._plan_herbivores
+    _plan_carnivores = World._plan_carnivores
+    _graze_arrays = World._graze_arrays
+    _regraze_arrays = World._regraze_arrays
+    _roll_reproduction = World._roll_reproduction
+    _hunt_arrays = World._hunt_arrays
+    _offspring = World._offspring
+    save = World.save
+    load = classmethod(World.load.__func__)
+
+    def init_population(self):
+        """
+        Sets every world up like World(engine='arrays', seed=s) followed by 
+        init_population(), one at a time, and gathers their plants and 
+        animals into the stacked arrays.
+        """
+        for k, seed in enumerate(self.seeds):
+            world = World(engine='arrays', seed=seed)
+            world.init_population()
+            self.plants[k] = world.plants
+            columns = {name: world.population[name] for name in world.population.data}
+            columns['world'] = np.full(len(world.population), k)
+            self.population.append(**columns)
+            self.counts[k] = world.counts
+            self.species_sizes[k] = world.species_sizes
+            self.gene_sums[k] = world.gene_sums
+            self.gene_squares[k] = world.gene_squares
+
+    def _snapshot_args(self):
+        return {'size': len(self.active), 'seed': self.seed}
+
+    def stats(self, world):
+        """
+        Returns the World.stats() of world `world`.
+        """
+        return World.stats(self, world)
+
+    def gene_maxima(self, world):
+        """
+        Returns the World.gene_maxima() of world `world`.
+        """
+        return World.gene_maxima(self, world)
+
+    def create_grid_image(self, world, indexed=False, species_colors=None):
+        """
+        Returns the World.create_grid_image() of world `world`.
+        """
+        return World.create_grid_image(self, indexed, species_colors, world)
+
+    def grid_indices(self, world):
+        """
+        Returns the World.grid_indices() of world `world`.
+        """
+        return World.grid_indices(self, world)
+
+    def checksum(self, world):
+        """
+        Returns the checksum() of world `world`. A world that ended keeps its 
+        plant layer and count grid, but its animals are gone from the 
+        energy and age totals.
+        """
+        return World.checksum(self, world)
+
+    def species_counts(self):
+        """
+        Returns the (size, species) array of the number of animals of every 
+        species in every world. Worlds that ended keep their last counts.
+        """
+        return self.species_sizes.copy()
+
+    def step(self):
+        """
+        Advances every running world by one tick, then ends the worlds left 
+        without herbivores or without carnivores: their animals are dropped, 
+        and their plant layers, count grids and stats() stay as they were.
+        """
+        if not self.active.any():
+            return
+        self._step_arrays()
+        self.ticks[self.active] += 1
+
+        sizes = self.species_counts()
+        extinct = (sizes[:, IS_HERBIVORE].sum(axis=1) == 0) | (sizes[:, ~IS_HERBIVORE].sum(axis=1) == 0)
+        ended = self.active & extinct
+        if ended.any():
+            self.active &= ~ended
+            self.population.keep(~ended[self.population['world']])
+
+    def regrow(self):
+        """
+        Regrows the plants of the running worlds like World.regrow (see 
+        regrow_layers), with one draw per cell.
+        """
+        plants = self.plants[self.active]
+        regrow_layers(plants, self.rng.random(plants.shape))
+        self.plants[self.active] = plants
 
 class Cell():
     def __init__(self, x, y, world):
         """
-        Initializes a single grid cell with specific coordinates, a reference to the 
-        main world, and an initial random probability of containing a plant.
+        Initializes a single grid cell with specific coordinates and a reference to the 
+        main world, whose plant layer holds this cell's plant.
         """
         self.x = x
         self.y = y
         self.world = world
-        self.plant = 1 if random.uniform(0, 1) < config.P_INIT_PLANT else 0
-        self.entities = []
+        # Occupants as dict keys: O(1) removal, iteration in arrival order
+        self.entities = {}
+
+    @property
+    def plant(self):
+        """
+        1 if the cell holds a plant, else 0 (stored in the world's plant layer).
+        """
+        return self.world.plants[self.y, self.x]
+
+    @plant.setter
+    def plant(self, value):
+        self.world.plants[self.y, self.x] = value
         
     def add(self, entity):
         """
-        Adds an entity to this cell's internal list and updates the entity's 
-        internal coordinate references to match this cell.
+        Adds an entity to this cell's occupants, counts it in the world's 
+        count grid and updates the entity's internal coordinate references 
+        to match this cell.
         """
-        self.entities.append(entity)
+        self.entities[entity] = None
+        self.world.counts[self.y, self.x, SPECIES_INDEX[type(entity)]] += 1
         entity.x = self.x
         entity.y = self.y
 
     def remove(self, entity):
         """
-        Removes a specific entity from this cell's internal list of occupants.
+        Removes a specific entity from this cell's occupants and from the 
+        world's count grid.
         """
         if entity in self.entities:
-            self.entities.remove(entity)
+            del self.entities[entity]
+            self.world.counts[self.y, self.x, SPECIES_INDEX[type(entity)]] -= 1
 
 class Animal():
-    def __init__(self, x, y, energy, speed, vision, sociability):
+    def __init__(self, x, y, energy, speed, vision, sociability, rng=None):
         """
         Initializes the base attributes shared by all animals, including location, 
         metabolic stats, movement genes, and lifespan parameters.
@@ -277,22 +1112,26 @@ class Animal():
         self.sociability = sociability
         self.is_dead = False
         self.age = 0
-        self.max_life = random.randint(config.MIN_LIFESPAN, config.MAX_LIFESPAN)
+        if rng is None: rng = DEFAULT_RNG
+        self.max_life = int(rng.integers(config.MIN_LIFESPAN, config.MAX_LIFESPAN, endpoint=True))
 
-    def mutate(self):
+    def mutate(self, rng=None):
         """
         Iterates through the animal's genome and randomly increments or decrements 
         gene values based on the mutation probability defined in the config.
         """
+        if rng is None: rng = DEFAULT_RNG
         genome = self.get_genome()
-        for gene in genome.keys():
-            if random.random() < config.P_MUTATION:
+        # Mutation mask and directions of the whole genome, one draw each
+        flips = (rng.random(len(genome)) < config.P_MUTATION).tolist()
+        changes = np.where(rng.random(len(genome)) < 0.5, -1, 1).tolist()
+        for gene, flip, change in zip(genome.keys(), flips, changes):
+            if flip:
                 current_value = getattr(self, gene)
-                change = random.choice([-1, 1])
                 new_val = max(1, current_value + change)
                 setattr(self, gene, new_val)
 
-    def reproduce_asexual(self):
+    def reproduce_asexual(self, rng=None):
         """
         Creates and returns a new offspring instance. The parent transfers half 
         its energy to the child, and the child inherits the parent's genome 
@@ -300,17 +1139,19 @@ class Animal():
         """
         cost = self.energy // 2
         self.energy -= cost
-        child = type(self)(self.x, self.y, cost, **self.get_genome())
-        child.mutate()
+        child = type(self)(self.x, self.y, cost, **self.get_genome(), rng=rng)
+        child.mutate(rng)
         return child
 
 class Herbivore(Animal):
-    def __init__(self, x, y, energy, speed, vision, sociability, armor, w_plant, w_threat):
+    GENOME = ('speed', 'vision', 'sociability', 'armor', 'w_plant', 'w_threat')
+
+    def __init__(self, x, y, energy, speed, vision, sociability, armor, w_plant, w_threat, rng=None):
         """
         Initializes a Herbivore with specific defensive attributes (armor) and 
         behavioral weights (attraction to plants vs. fear of threats).
         """
-        super().__init__(x, y, energy, speed, vision, sociability)
+        super().__init__(x, y, energy, speed, vision, sociability, rng=rng)
         self.armor = armor
         self.w_plant = w_plant
         self.w_threat = w_threat
@@ -323,7 +1164,7 @@ class Herbivore(Animal):
         return {'speed': self.speed, 'vision': self.vision, 'sociability': self.sociability, 'armor': self.armor,
                 'w_plant': self.w_plant, 'w_threat': self.w_threat}
 
-    def plan(self, world):
+    def plan(self, world, tie_break=None):
         """
         Evaluates the local neighborhood to determine the best destination cell.
         Scores potential moves based on food proximity, distance from Carnivores 
@@ -367,16 +1208,20 @@ class Herbivore(Animal):
             return world.get_cell(self.x, self.y)
 
         max_score = max(scores.values())
-        best_cells = [cell for cell, score in scores.items() if score == max_score]
-        return random.choice(best_cells) # Avoid going always in the same direction if all cells are equal
+        # Scores an ulp apart from rounding are ties too
+        best_cells = [cell for cell, score in scores.items() if abs(score - max_score) <= TIE_TOLERANCE * abs(max_score)]
+        if tie_break is None: tie_break = world.rng.random()
+        return best_cells[int(tie_break * len(best_cells))] # Avoid going always in the same direction if all cells are equal
 
 class Carnivore(Animal):
-    def __init__(self, x, y, energy, speed, vision, sociability, strength, w_prey, w_competition):
+    GENOME = ('speed', 'vision', 'sociability', 'strength', 'w_prey', 'w_competition')
+
+    def __init__(self, x, y, energy, speed, vision, sociability, strength, w_prey, w_competition, rng=None):
         """
         Initializes a Carnivore with specific offensive attributes (strength) and 
         behavioral weights (attraction to prey vs. avoidance of competition).
         """
-        super().__init__(x, y, energy, speed, vision, sociability)
+        super().__init__(x, y, energy, speed, vision, sociability, rng=rng)
         self.strength = strength
         self.w_prey = w_prey
         self.w_competition = w_competition
@@ -389,7 +1234,7 @@ class Carnivore(Animal):
         return {'speed': self.speed, 'vision': self.vision, 'sociability': self.sociability,
                 'strength': self.strength, 'w_prey': self.w_prey, 'w_competition': self.w_competition}
 
-    def plan(self, world):
+    def plan(self, world, tie_break=None):
         """
         Evaluates the local neighborhood to determine the best destination cell.
         Scores potential moves based on prey proximity and avoidance of other 
@@ -426,5 +1271,470 @@ class Carnivore(Animal):
             return world.get_cell(self.x, self.y)
 
         max_score = max(scores.values())
-        best_cells = [cell for cell, score in scores.items() if score == max_score]
-        return random.choice(best_cells)
\ No newline at end of file
+        # Scores an ulp apart from rounding are ties too
+        best_cells = [cell for cell, score in scores.items() if abs(score - max_score) <= TIE_TOLERANCE * abs(max_score)]
+        if tie_break is None: tie_break = world.rng.random()
+        return best_cells[int(tie_break * len(best_cells))]
+
+# Generator for Animals created outside a World, which passes its own
+DEFAULT_RNG = np.random.default_rng()
+
+# Format version of World.save() snapshots, raised when their layout changes
+SNAPSHOT_VERSION = 1
+
+# Species registry of the array engine: a row's species id indexes this tuple
+SPECIES = (Herbivore, Carnivore)
+SPECIES_INDEX = {cls: k for k, cls in enumerate(SPECIES)}
+GENE_COLUMNS = ('speed', 'vision', 'sociability', 'armor', 'strength', 'w_plant', 'w_threat', 'w_prey', 'w_competition')
+
+IS_HERBIVORE = np.array([issubclass(cls, Herbivore) for cls in SPECIES])
+HAS_GENE = np.array([[gene in cls.GENOME for gene in GENE_COLUMNS] for cls in SPECIES])
+# Mutation bounds per species and gene (genes never drop below 1)
+GENE_MIN = np.ones((len(SPECIES), len(GENE_COLUMNS)), dtype=np.int64)
+GENE_MAX = np.full((len(SPECIES), len(GENE_COLUMNS)), np.iinfo(np.int64).max)
+
+def grid_palette(species_colors=None):
+    """
+    Returns the float RGB palette of World.grid_indices(): brown ground, 
+    green grass, then one colour per species of SPECIES, blue for 
+    herbivores and red for carnivores unless species_colors gives one.
+    """
+    species_colors = species_colors or {}
+    palette = [[0.6, 0.4, 0.2], [0.2, 0.8, 0.2]] # Brown ground, green grass
+    for cls in SPECIES:
+        palette.append(species_colors.get(cls, [0, 0, 1] if issubclass(cls, Herbivore) else [1, 0, 0]))
+    return np.array(palette, dtype=float)
+
+@functools.lru_cache(maxsize=None)
+def window_offsets(radius):
+    """
+    Returns the (dx, dy) offsets of the cells within a square radius, in the 
+    row-major order of get_neighborhood_cells. The arrays are shared: do not modify.
+    """
+    dy, dx = np.divmod(np.arange((2 * radius + 1)**2), 2 * radius + 1)
+    dx, dy = dx - radius, dy - radius
+    dx.flags.writeable = dy.flags.writeable = False
+    return dx, dy
+
+@functools.lru_cache(maxsize=None)
+def inverse_square_kernel(move_radius, view_radius):
+    """
+    Returns the (move cells x visible cells) matrix of 1 / dist_sq between 
+    the offsets of the two windows, with dist_sq = 0 clamped to 0.1 as in the 
+    planners. The matrix is shared: do not modify.
+    """
+    mdx, mdy = window_offsets(move_radius)
+    vdx, vdy = window_offsets(view_radius)
+    dist_sq = ((vdx[None, :] - mdx[:, None])**2 + (vdy[None, :] - mdy[:, None])**2).astype(float)
+    dist_sq[dist_sq == 0] = 0.1
+    kernel = 1 / dist_sq
+    kernel.flags.writeable = False
+    return kernel
+
+@functools.lru_cache(maxsize=None)
+def neighborhood_table(radius):
+    """
+    Returns the (DIM*DIM, (2r+1)**2) table of the flat indices (y * DIM + x) 
+    of the cells within a square radius around every cell, in the row-major 
+    order of get_neighborhood_cells, with toroidal wrapping. Row c is the 
+    neighborhood of the cell with flat index c. The table is shared: do not modify.
+    """
+    dx, dy = window_offsets(radius)
+    y, x = np.divmod(np.arange(config.DIM**2), config.DIM)
+    table = (((y[:, None] + dy) % config.DIM) * config.DIM + (x[:, None] + dx) % config.DIM).astype(np.int32)
+    table.flags.writeable = False
+    return table
+
+def flat_cells(world, x, y):
+    """
+    Returns the flat indices of cells (x, y) of the given worlds in the 
+    plant layers and count grids: (world * DIM + y) * DIM + x, where world 
+    is the index of a world in a WorldEnsemble and 0 in a single World.
+    """
+    return (world * config.DIM + y) * config.DIM + x
+
+def window_cells(x, y, radius, world=0):
+    """
+    Returns the flat indices (see flat_cells) of the cells within a square 
+    radius around every (x, y) of the given worlds, one row per center, with 
+    toroidal wrapping inside each world.
+    """
+    return neighborhood_table(radius)[y * config.DIM + x] + np.asarray(world * config.DIM**2)[..., None]
+
+def inverse_square_sums(x, y, move_radius, view_radius, *layers):
+    """
+    For every center (x, y) and every cell of its move window, sums the 
+    visible values of each layer (one (n, visible cells) array per layer) 
+    weighted by 1 / dist_sq. Distances are taken between wrapped coordinates 
+    like in the scalar planners, so only centers away from the edges share 
+    the precomputed kernel; the others get a kernel of their own.
+    """
+    values = np.stack(layers, axis=-1).astype(float)
+    sums = np.empty((len(x), (2 * move_radius + 1)**2, len(layers)))
+
+    reach = max(move_radius, view_radius)
+    inside = (x >= reach) & (x < config.DIM - reach) & (y >= reach) & (y < config.DIM - reach)
+    sums[inside] = inverse_square_kernel(move_radius, view_radius) @ values[inside]
+
+    mdx, mdy = window_offsets(move_radius)
+    vdx, vdy = window_offsets(view_radius)
+    edge = np.flatnonzero(~inside)
+    # Bound the size of the per-center kernels
+    chunk = max(1, 2**21 // (len(mdx) * len(vdx)))
+    for start in range(0, len(edge), chunk):
+        rows = edge[start:start + chunk]
+        mx = (x[rows, None] + mdx) % config.DIM
+        my = (y[rows, None] + mdy) % config.DIM
+        vx = (x[rows, None] + vdx) % config.DIM
+        vy = (y[rows, None] + vdy) % config.DIM
+        dist_sq = ((vx[:, None, :] - mx[:, :, None])**2 + (vy[:, None, :] - my[:, :, None])**2).astype(float)
+        dist_sq[dist_sq == 0] = 0.1
+        sums[rows] = (1 / dist_sq) @ values[rows]
+    return [sums[..., k] for k in range(len(layers))]
+
+# Relative difference under which the planners take two scores for a tie
+TIE_TOLERANCE = 1e-12
+
+def pick_best(scores, tie_breaks):
+    """
+    Returns the column of a maximum of every row of scores. Ties are broken 
+    like random.choice over the best cells in row order: the uniform draw 
+    u picks the int(u * count)-th of them. As in the scalar planners, the 
+    scores within TIE_TOLERANCE (relative) of the maximum are tied: scores 
+    that are equal but summed in another order may come out an ulp apart.
+    """
+    best = np.isclose(scores, scores.max(axis=1, keepdims=True), rtol=TIE_TOLERANCE, atol=0)
+    nth = (tie_breaks * best.sum(axis=1)).astype(np.int64)
+    return np.argmax(np.cumsum(best, axis=1) > nth[:, None], axis=1)
+
+def regrow_layers(plants, draws):
+    """
+    Applies the regrowth rule of World.regrow to every cell of a plant 
+    layer, or of a stack of them with shape (..., DIM, DIM), in place and in the same order as a row by 
+    row scan, one row at a time. Plants grown earlier in the pass count as 
+    neighbors of later cells, like in the scan. Within a row only the left 
+    neighbor depends on the pass: a cell grows if it would grow without it 
+    (A), or with it (B) and its left neighbor grew, which is solved for the 
+    whole row with running maxima instead of a loop over x. draws holds the 
+    uniform draw of every cell.
+    """
+    columns = np.arange(config.DIM)
+    for y in range(config.DIM):
+        # Rows above are already updated and rows below are not, wrap included
+        up, row, down = plants[..., y - 1, :], plants[..., y, :], plants[..., (y + 1) % config.DIM, :]
+        vertical = up + row + down
+        # Plant neighbors other than the left one (x+1 wraps to the old x=0)
+        others = vertical + np.roll(vertical, -1, axis=-1) + np.roll(up + down, 1, axis=-1)
+
+        # Probability increases with more plant neighbors
+        chance = config.P_PLANT + (config.P_PLANT_NEIGHBOR_FACTOR * others)
+        chance_left = config.P_PLANT + (config.P_PLANT_NEIGHBOR_FACTOR * (others + 1))
+        grows = (row > 0) | (draws[..., y, :] < chance)
+        grows_left = (row > 0) | (draws[..., y, :] < chance_left)
+        # The first cell's left neighbor is the not yet updated last one
+        last_grown = np.maximum.accumulate(np.where(grows, columns, -2), axis=-1)
+        last_blocked = np.maximum.accumulate(np.where(grows_left, -2, columns), axis=-1)
+        grown = np.maximum(last_grown, np.where(row[..., -1:] > 0, -1, -2)) > last_blocked
+
+        # The last cell's right neighbor is the updated first one
+        wraps = grown[..., 0] & (row[..., 0] == 0) & (row[..., -1] == 0)
+        if wraps.any():
+            chance = config.P_PLANT + (config.P_PLANT_NEIGHBOR_FACTOR * (others[..., -1] + 1))
+            chance_left = config.P_PLANT + (config.P_PLANT_NEIGHBOR_FACTOR * (others[..., -1] + 2))
+            draw = draws[..., y, -1]
+            grown[..., -1] = np.where(wraps, (draw < chance) | ((draw < chance_left) & grown[..., -2]), grown[..., -1])
+        row[grown] = 1
+
+@functools.lru_cache(maxsize=None)
+def jit_kernels():
+    """
+    Compiles the kernels below with Numba on first use and returns them by 
+    name, or returns None when Numba is not installed. Numba is only 
+    imported here, so it stays an optional dependency.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    kernels = {'plan': plan_kernel, 'move': move_kernel, 'action': action_kernel, 'regrow': regrow_kernel}
+    return {name: numba.njit(cache=True)(kernel) for name, kernel in kernels.items()}
+
+def plan_kernel(plants, herbs, carns, x, y, speed, vision, sociability, herbivore,
+                w_plant, w_threat, w_prey, w_competition, tie_breaks, dim, dest_x, dest_y):
+    """
+    Herbivore.plan and Carnivore.plan for every row, written for Numba. 
+    plants, herbs and carns are the flat plant layer and per-cell counts. 
+    Scores add up term by term in the order of the scalar planners, so the 
+    destinations (written into dest_x, dest_y) are those of the object engine.
+    """
+    reach = 0
+    for i in range(len(x)):
+        reach = max(reach, speed[i], vision[i])
+    scores = np.empty((2 * reach + 1)**2)
+    # Visible cells worth a term: wrapped coordinates and count
+    seen_x = np.empty((2 * reach + 1)**2, dtype=np.int64)
+    seen_y = np.empty_like(seen_x)
+    seen_n = np.empty_like(seen_x)
+    prey_x = np.empty_like(seen_x)
+    prey_y = np.empty_like(seen_x)
+    prey_n = np.empty_like(seen_x)
+
+    for i in range(len(x)):
+        side, view = 2 * speed[i] + 1, 2 * vision[i] + 1
+        # Herbivores see plants and carnivores, carnivores see herbivores 
+        # and the other carnivores
+        seen, prey = 0, 0
+        for v in range(view * view):
+            vx = (x[i] + v % view - vision[i]) % dim
+            vy = (y[i] + v // view - vision[i]) % dim
+            cell = vy * dim + vx
+            carn_count = carns[cell] - (0 if herbivore[i] or cell != y[i] * dim + x[i] else 1)
+            if carn_count > 0:
+                seen_x[seen], seen_y[seen], seen_n[seen] = vx, vy, carn_count
+                seen += 1
+            food = plants[cell] if herbivore[i] else herbs[cell]
+            if food > 0:
+                prey_x[prey], prey_y[prey], prey_n[prey] = vx, vy, 1 if herbivore[i] else food
+                prey += 1
+
+        for m in range(side * side):
+            mx = (x[i] + m % side - speed[i]) % dim
+            my = (y[i] + m // side - speed[i]) % dim
+            score = 0.0
+            if herbivore[i]:
+                # FOOD ATTRACTION
+                if plants[my * dim + mx]:
+                    score += w_plant[i]
+                else:
+                    for k in range(prey):
+                        dist_sq = (prey_x[k] - mx)**2 + (prey_y[k] - my)**2
+                        score += (w_plant[i] * 0.5) / (0.1 if dist_sq == 0 else dist_sq)
+                # THREAT AVOIDANCE
+                for k in range(seen):
+                    dist_sq = (seen_x[k] - mx)**2 + (seen_y[k] - my)**2
+                    for _ in range(seen_n[k]):
+                        score -= w_threat[i] / (0.1 if dist_sq == 0 else dist_sq)
+                # HERDING
+                herd_count = herbs[my * dim + mx] - (1 if mx == x[i] and my == y[i] else 0)
+                score += herd_count * (sociability[i] - 1)
+            else:
+                # PREY ATTRACTION
+                for k in range(prey):
+                    dist_sq = (prey_x[k] - mx)**2 + (prey_y[k] - my)**2
+                    for _ in range(prey_n[k]):
+                        score += w_prey[i] / (0.1 if dist_sq == 0 else dist_sq)
+                # COMPETITION AVOIDANCE
+                for k in range(seen):
+                    dist_sq = (seen_x[k] - mx)**2 + (seen_y[k] - my)**2
+                    for _ in range(seen_n[k]):
+                        score -= (w_competition[i] * (1 / sociability[i])) / (0.1 if dist_sq == 0 else dist_sq)
+            scores[m] = score
+
+        # Ties are broken like in the scalar planners
+        best = scores[:side * side].max()
+        tied = np.abs(scores[:side * side] - best) <= TIE_TOLERANCE * abs(best)
+        nth = int(tie_breaks[i] * np.count_nonzero(tied))
+        for m in range(side * side):
+            if tied[m]:
+                if nth == 0:
+                    dest_x[i] = (x[i] + m % side - speed[i]) % dim
+                    dest_y[i] = (y[i] + m // side - speed[i]) % dim
+                    break
+                nth -= 1
+
+def move_kernel(x, y, energy, species, dest_x, dest_y, counts, n_species, dim, move_cost):
+    """
+    Movement phase, written for Numba: every row pays its way to its 
+    destination or stays put, and the flat count grid follows.
+    """
+    for i in range(len(x)):
+        if dest_x[i] != x[i] or dest_y[i] != y[i]:
+            dist = math.sqrt((x[i] - dest_x[i])**2 + (y[i] - dest_y[i])**2)
+            cost = int(dist * move_cost)
+            if energy[i] > cost:
+                counts[(y[i] * dim + x[i]) * n_species + species[i]] -= 1
+                x[i], y[i] = dest_x[i], dest_y[i]
+                counts[(y[i] * dim + x[i]) * n_species + species[i]] += 1
+                energy[i] -= cost
+
+def action_kernel(order, x, y, energy, age, max_life, is_dead, species, herbivore, strength, armor,
+                  plants, counts, n_species, dim, herb_start, herb_rows, herb_rolls, hunt_draws, carn_rolls,
+                  child_energy, idle_cost, energy_per_plant, energy_per_prey, hunt_cost, max_energy,
+                  threshold, p_reproduce_herb, p_reproduce_carn):
+    """
+    Action phase of step(), written for Numba: rows take their turn in the 
+    shuffled order, one at a time. Parents hand half their energy over into 
+    child_energy, and the dead are marked is_dead and taken off the flat 
+    count grid. Herbivore rows are grouped by cell in herb_rows, see _step_jit.
+    """
+    prey_list = np.empty(len(herb_rows), dtype=np.int64)
+    hunter = 0
+    for i in order:
+        if is_dead[i]: continue
+
+        # METABOLISM AND AGING
+        age[i] += 1
+        energy[i] -= idle_cost
+
+        # Death by old age or starvation
+        if energy[i] <= 0 or age[i] >= max_life[i]:
+            is_dead[i] = True
+            counts[(y[i] * dim + x[i]) * n_species + species[i]] -= 1
+            continue
+
+        # HERBIVORE LOGIC
+        if herbivore[i]:
+            # Graze
+            cell = y[i] * dim + x[i]
+            if plants[cell] > 0:
+                # Don't exceed max energy
+                energy[i] += min(energy_per_plant, max_energy - energy[i])
+                plants[cell] = 0
+
+            # Reproduce
+            if energy[i] >= threshold and herb_rolls[i] < p_reproduce_herb:
+                child_energy[i] = energy[i] // 2
+                energy[i] -= child_energy[i]
+
+        # CARNIVORE LOGIC
+        else:
+            # Hunt
+            action_taken = False
+            prey_count = 0
+            for k in range(9):
+                cell = ((y[i] + k // 3 - 1) % dim) * dim + (x[i] + k % 3 - 1) % dim
+                for j in herb_rows[herb_start[cell]:herb_start[cell + 1]]:
+                    if not is_dead[j]:
+                        prey_list[prey_count] = j
+                        prey_count += 1
+
+            if prey_count:
+                prey = prey_list[int(hunt_draws[hunter, 0] * prey_count)]
+                advantage = (strength[i] * energy[i])
+                defense = (armor[prey] * energy[prey])
+                success_chance = 0.5 + 0.5 * ((advantage - defense) / (advantage + defense))
+
+                if hunt_draws[hunter, 1] < success_chance:
+                    # Successful hunt, max energy check
+                    energy[i] += min(energy_per_prey, max_energy - energy[i])
+                    is_dead[prey] = True
+                    counts[(y[prey] * dim + x[prey]) * n_species + species[prey]] -= 1
+                    action_taken = True
+                else:
+                    # Failed hunt
+                    energy[i] -= hunt_cost
+            hunter += 1
+
+            # Reproduce
+            if not action_taken and energy[i] >= threshold and carn_rolls[i] < p_reproduce_carn:
+                child_energy[i] = energy[i] // 2
+                energy[i] -= child_energy[i]
+
+def regrow_kernel(plants, draws, p_plant, p_plant_neighbor_factor):
+    """
+    The row by row regrowth scan over the (DIM, DIM) plant layer, written 
+    for Numba, with one draw per cell.
+    """
+    dim = plants.shape[0]
+    for y in range(dim):
+        for x in range(dim):
+            if plants[y, x] == 0:
+                grow_factor = 0
+                for k in range(9):
+                    if plants[(y + k // 3 - 1) % dim, (x + k % 3 - 1) % dim]:
+                        grow_factor += 1
+
+                # Probability increases with more plant neighbors
+                chance = p_plant + (p_plant_neighbor_factor * grow_factor)
+                if draws[y, x] < chance:
+                    plants[y, x] = 1
+
+class Population():
+    """
+    Struct-of-arrays store used by the array engine: every animal is a row 
+    and every attribute (world, position, metabolism, species id, genes) is a NumPy 
+    column, so a phase of the tick is a handful of array operations instead 
+    of attribute lookups on thousands of objects. The behavioral weights 
+    (w_* genes) are float columns, as config may set them to any number, 
+    and the other columns are int64.
+    """
+    COLUMNS = ('world', 'x', 'y', 'energy', 'age', 'max_life', 'species') + GENE_COLUMNS
+    FLOAT_COLUMNS = tuple(gene for gene in GENE_COLUMNS if gene.startswith('w_'))
+
+    def __init__(self, capacity=256):
+        """
+        Allocates empty columns with room for `capacity` rows; the columns 
+        grow geometrically when more rows are appended.
+        """
+        self.size = 0
+        self.data = {name: np.zeros(capacity, dtype=float if name in self.FLOAT_COLUMNS else np.int64)
+                     for name in self.COLUMNS}
+        self.data['is_dead'] = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        """
+        Returns a view of the rows in use of a column. Writes into the view 
+        update the population in place.
+        """
+        return self.data[name][:self.size]
+
+    def reserve(self, capacity):
+        """
+        Makes sure the columns can hold at least `capacity` rows.
+        """
+        current = len(self.data['x'])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, 2 * current)
+        for name, column in self.data.items():
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.data[name] = grown
+
+    def append(self, **columns):
+        """
+        Appends a batch of rows given as one array per column. Columns that 
+        are not given are zero (is_dead is False).
+        """
+        count = len(columns['x'])
+        self.reserve(self.size + count)
+        for name, column in self.data.items():
+            column[self.size:self.size + count] = columns.get(name, 0)
+        self.size += count
+
+    def keep(self, mask):
+        """
+        Drops the rows where `mask` is False, preserving the order of the others.
+        """
+        kept = int(np.count_nonzero(mask))
+        for column in self.data.values():
+            column[:kept] = column[:self.size][mask]
+        self.size = kept
+
+    def append_entities(self, entities):
+        """
+        Appends Animal objects as rows. Genes an animal does not have are stored as 0.
+        """
+        columns = {name: [getattr(e, name, 0) for e in entities] for name in self.COLUMNS if name != 'species'}
+        columns['species'] = [SPECIES_INDEX[type(e)] for e in entities]
+        columns['is_dead'] = [e.is_dead for e in entities]
+        self.append(**columns)
+
+    def to_entities(self):
+        """
+        Returns a snapshot of the rows as Animal objects, e.g. for code that 
+        expects all_entities. Changes to the objects are not written back.
+        """
+        entities = []
+        rows = {name: self[name].tolist() for name in self.data}
+        for i in range(self.size):
+            cls = SPECIES[rows['species'][i]]
+            # Bypass __init__, which would draw a new lifespan
+            entity = cls.__new__(cls)
+            entity.__dict__.update({name: rows[name][i] for name in ('x', 'y', 'energy', 'age', 'max_life', 'is_dead')})
+            entity.__dict__.update({gene: rows[gene][i] for gene in cls.GENOME})
+            entities.append(entity)
+        return entities
\ No newline at end of file
@@ -0,0 +1,196 @@
+import copy
+import numpy as np
+import pytest
+import config
+import source_baseline
+from source_baseline import World, WorldEnsemble, regrow_kernel, regrow_layers
+
+# (engine, jit) of every way to step a World
+ENGINES = [('objects', False), ('arrays', False), ('arrays', True)]
+TICKS = 10
+
+def make_world(engine, jit, seed=7):
+    if jit:
+        pytest.importorskip('numba')
+    world = World(engine=engine, seed=seed, jit=jit)
+    world.init_population()
+    return world
+
+@pytest.mark.parametrize('density', [0.0, 0.05, 0.3, 0.9])
+def test_regrow_layers_matches_kernel(density):
+    rng = np.random.default_rng(int(density * 100))
+    plants = (rng.random((config.DIM, config.DIM)) < density).astype(np.int8)
+    draws = rng.random(plants.shape)
+    expected = plants.copy()
+    regrow_kernel(expected, draws, config.P_PLANT, config.P_PLANT_NEIGHBOR_FACTOR)
+    regrow_layers(plants, draws)
+    np.testing.assert_array_equal(plants, expected)
+
+def test_regrow_layers_stack_matches_single_layers():
+    rng = np.random.default_rng(1)
+    stack = (rng.random((3, config.DIM, config.DIM)) < 0.2).astype(np.int8)
+    draws = rng.random(stack.shape)
+    layers = [layer.copy() for layer in stack]
+    regrow_layers(stack, draws)
+    for layer, layer_draws, expected in zip(layers, draws, stack):
+        regrow_layers(layer, layer_draws)
+        np.testing.assert_array_equal(layer, expected)
+
+def test_jit_regrow_matches_kernel():
+    kernels = source_baseline.jit_kernels()
+    if kernels is None:
+        pytest.skip("Numba is not installed")
+    rng = np.random.default_rng(2)
+    plants = (rng.random((config.DIM, config.DIM)) < 0.2).astype(np.int8)
+    draws = rng.random(plants.shape)
+    expected = plants.copy()
+    regrow_kernel(expected, draws, config.P_PLANT, config.P_PLANT_NEIGHBOR_FACTOR)
+    kernels['regrow'](plants, draws, config.P_PLANT, config.P_PLANT_NEIGHBOR_FACTOR)
+    np.testing.assert_array_equal(plants, expected)
+
+@pytest.mark.parametrize('engine, jit', ENGINES)
+def test_replay_matches_recorded_run(engine, jit):
+    world = make_world(engine, jit)
+    checksums = []
+    for _ in range(TICKS):
+        world.step()
+        checksums.append(world.checksum())
+    replayed = World.replay(7, checksums, engine=engine, jit=jit)
+    assert replayed.checksum() == checksums[-1]
+
+@pytest.mark.parametrize('engine, jit', ENGINES)
+def test_replay_detects_divergence(engine, jit):
+    world = make_world(engine, jit)
+    world.step()
+    with pytest.raises(RuntimeError):
+        World.replay(7, [world.checksum() ^ 1], engine=engine, jit=jit)
+
+@pytest.mark.parametrize('engine, jit', ENGINES)
+def test_loaded_world_goes_on_like_the_saved_one(engine, jit, tmp_path):
+    world = make_world(engine, jit)
+    for _ in range(TICKS):
+        world.step()
+    world.save(tmp_path / "world.npz")
+    loaded = World.load(tmp_path / "world.npz")
+    assert loaded.checksum() == world.checksum()
+    assert loaded.stats() == world.stats()
+    for _ in range(TICKS):
+        world.step()
+        loaded.step()
+        assert loaded.checksum() == world.checksum()
+
+def recomputed_stats(world):
+    """world.stats() computed from scratch over the living animals."""
+    stats = {}
+    for k, cls in enumerate(source_baseline.SPECIES):
+        if world.population is None:
+            animals = [entity for entity in world.all_entities if type(entity) is cls and not entity.is_dead]
+            genes = {gene: np.array([getattr(entity, gene) for entity in animals]) for gene in cls.GENOME}
+        else:
+            rows = world.population['species'] == k
+            genes = {gene: world.population[gene][rows] for gene in cls.GENOME}
+        stats[cls.__name__] = {'count': len(genes['speed']),
+                               'mean': {gene: float(np.mean(values)) if len(values) else 0.0 for gene, values in genes.items()},
+                               'std': {gene: float(np.std(values)) if len(values) else 0.0 for gene, values in genes.items()}}
+    return stats
+
+def flat_stats(stats):
+    """The values of a world.stats() dict by (species, field, gene), for pytest.approx."""
+    return {(name, field, gene): value for name, species in stats.items()
+            for field, values in species.items() if field != 'count' for gene, value in values.items()}
+
+def assert_stats_match(world):
+    stats, expected = world.stats(), recomputed_stats(world)
+    assert {name: species['count'] for name, species in stats.items()} == \
+           {name: species['count'] for name, species in expected.items()}
+    assert flat_stats(stats) == pytest.approx(flat_stats(expected))
+
+@pytest.mark.parametrize('engine, jit', ENGINES)
+def test_stats_match_a_full_recompute(engine, jit):
+    world = make_world(engine, jit)
+    for _ in range(TICKS):
+        world.step()
+        assert_stats_match(world)
+
+@pytest.mark.parametrize('engine, jit', ENGINES)
+def test_stats_keep_non_integer_genes(engine, jit, monkeypatch):
+    monkeypatch.setattr(config, 'W_HERB_THREAT', 2.5)
+    world = make_world(engine, jit)
+    for _ in range(TICKS):
+        world.step()
+    assert_stats_match(world)
+    assert any(species['mean'].get('w_threat', 0) % 1 for species in world.stats().values())
+
+def test_population_keeps_non_integer_weights(monkeypatch):
+    monkeypatch.setattr(config, 'W_HERB_THREAT', 2.5)
+    world = make_world('arrays', False)
+    population = world.population
+    herbivores = source_baseline.IS_HERBIVORE[population['species']]
+    assert np.all(population['w_threat'][herbivores] == 2.5)
+
+def objects_copy(world):
+    """An object engine World in the state of an array engine one, for the scalar rules."""
+    copy = World(engine='objects', seed=0)
+    copy.plants[...] = world.plants
+    copy.all_entities = world.population.to_entities()
+    for entity in copy.all_entities:
+        copy.get_cell(entity.x, entity.y).add(entity)
+    return copy
+
+@pytest.mark.parametrize('kind', [source_baseline.Herbivore, source_baseline.Carnivore])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_batched_planning_matches_the_scalar_planners(seed, kind):
+    world = make_world('arrays', False, seed)
+    for _ in range(2 * TICKS):
+        scalar = objects_copy(world)
+        state = world.rng.bit_generator.state
+        dest_x, dest_y = world._plan_arrays()
+        world.rng.bit_generator.state = state
+        # The tie-breaks _plan_arrays drew
+        tie_breaks = world.rng.random(len(world.population))
+        world.rng.bit_generator.state = state
+        for i, entity in enumerate(scalar.all_entities):
+            if not isinstance(entity, kind):
+                continue
+            cell = entity.plan(scalar, tie_breaks[i])
+            assert (cell.x, cell.y) == (dest_x[i], dest_y[i]), f"{type(entity).__name__} row {i}"
+        world.step()
+
+# The Numba kernels as plain Python: the rules one animal at a time, in the order of the object engine
+PYTHON_KERNELS = {'plan': source_baseline.plan_kernel, 'move': source_baseline.move_kernel,
+                  'action': source_baseline.action_kernel, 'regrow': source_baseline.regrow_kernel}
+
+def test_batched_tick_matches_the_one_at_a_time_rules():
+    world = make_world('arrays', False, 3)
+    for _ in range(5):
+        scalar = copy.deepcopy(world)
+        scalar.kernels = PYTHON_KERNELS
+        world.step()
+        scalar.step()
+        for name in world.population.data:
+            np.testing.assert_array_equal(world.population[name], scalar.population[name], err_msg=name)
+        np.testing.assert_array_equal(world.plants, scalar.plants)
+        assert world.checksum() == scalar.checksum()
+
+def test_ensemble_worlds_start_like_lone_worlds():
+    ensemble = WorldEnsemble(3, seed=5)
+    ensemble.init_population()
+    for k, seed in enumerate(np.random.SeedSequence(5).spawn(3)):
+        world = World(engine='arrays', seed=seed)
+        world.init_population()
+        assert ensemble.checksum(k) == world.checksum()
+        assert ensemble.stats(k) == world.stats()
+
+def test_loaded_ensemble_goes_on_like_the_saved_one(tmp_path):
+    ensemble = WorldEnsemble(3, seed=5)
+    ensemble.init_population()
+    for _ in range(TICKS):
+        ensemble.step()
+    ensemble.save(tmp_path / "ensemble.npz")
+    loaded = WorldEnsemble.load(tmp_path / "ensemble.npz")
+    assert not isinstance(loaded, World)
+    np.testing.assert_array_equal(loaded.ticks, ensemble.ticks)
+    for _ in range(TICKS):
+        ensemble.step()
+        loaded.step()
+        assert [loaded.checksum(k) for k in range(3)] == [ensemble.checksum(k) for k in range(3)]